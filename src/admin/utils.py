@@ -48,3 +48,25 @@ def log_gpu_usage():
         logging.info("GPU UTIL: {}/{}. {:.1f}% used".format(gpu_util, gpu_total, 100*gpu_util/gpu_total))
     else:
         pass
+
+def gpu_memory_mark():
+    '''
+    Start measuring peak GPU memory. Returns the baseline for
+    peak_gpu_memory, or None when it cannot be measured.
+    '''
+    if not torch.cuda.is_available() or not hasattr(torch.cuda, 'max_memory_allocated'):
+        return None
+    if hasattr(torch.cuda, 'reset_max_memory_allocated'):
+        torch.cuda.reset_max_memory_allocated()
+        return 0
+    # no reset in this version of torch: measure how far the peak so far rises
+    return torch.cuda.max_memory_allocated()
+
+def peak_gpu_memory(mark):
+    '''
+    Peak GPU memory in MB since gpu_memory_mark returned mark (without a
+    reset, how much it exceeded the earlier peak), or None
+    '''
+    if mark is None:
+        return None
+    return (torch.cuda.max_memory_allocated() - mark) / 2 ** 20
@@ -1,3 +1,5 @@
+import time
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -5,12 +7,20 @@ from torch.autograd import Variable
 
 from .simple._adjacency import _Adjacency
 from .simple import SIMPLE_ADJACENCIES
+from .pairwise import PairwiseTerms
 
 from src.monitors import Collect
 
 class ComboAdjacency(_Adjacency):
+    '''
+    Weighted sum of several adjacencies of the same vertices. When fused,
+    the pairwise quantities the components have in common (distances,
+    delta R) are computed once per forward through a shared PairwiseTerms,
+    and the weighted sum is accumulated in place.
+    '''
     def __init__(self, **kwargs):
         super().__init__(name='combo'+kwargs.get('index', 'ls'),**kwargs)
+        self.fused = True
 
     def initialize(self, adj_list=None, **kwargs):
         super().initialize(**kwargs)
@@ -35,13 +45,10 @@ class ComboAdjacency(_Adjacency):
         self.monitors.extend(self.component_monitors)
 
     def forward(self, h, mask, **kwargs):
-        # raw matrix
-        combo = Variable(torch.zeros(h.size()[0], h.size()[1], h.size()[1]))
-        if torch.cuda.is_available():
-            combo = combo.cuda()
-        for adj, weight in zip(self.adjs, self.weights):
-            M = adj(h, mask, **kwargs)
-            combo += M * weight
+        if self.fused:
+            combo = self.fused_sum(h, mask, **kwargs)
+        else:
+            combo = self.sequential_sum(h, mask, **kwargs)
 
         #if self.symmetric:
         #    M = 0.5 * (M + M.transpose(1, 2))
@@ -53,6 +60,34 @@ class ComboAdjacency(_Adjacency):
             self.logging(dij=combo, mask=mask, **kwargs)
         return combo
 
+    def sequential_sum(self, h, mask, **kwargs):
+        combo = Variable(torch.zeros(h.size()[0], h.size()[1], h.size()[1]))
+        if torch.cuda.is_available():
+            combo = combo.cuda()
+        for adj, weight in zip(self.adjs, self.weights):
+            M = adj(h, mask, **kwargs)
+            combo += M * weight
+        return combo
+
+    def fused_sum(self, h, mask, **kwargs):
+        terms = PairwiseTerms(h)
+        combo = None
+        for adj, weight in zip(self.adjs, self.weights):
+            M = adj(h, mask, terms=terms, **kwargs) * weight
+            if combo is None:
+                combo = M
+            else:
+                combo.add_(M)
+            del M
+        return combo
+
+    def edge_values(self, h, dst, src, n_nodes):
+        combo = None
+        for adj, weight in zip(self.adjs, self.weights):
+            values = adj.edge_values(h, dst, src, n_nodes) * weight
+            combo = values if combo is None else combo + values
+        return combo
+
     def logging(self, **kwargs):
         super().logging(**kwargs)
         if kwargs.get('epoch', None) is not None and kwargs.get('iters', None) == 0:
@@ -70,3 +105,34 @@ class LearnedComboAdjacency(ComboAdjacency):
     @property
     def weights(self):
         return F.softmax(self._weights, dim=0)
+
+
+def time_combo(adj_list=('phy', 'sq', 'norm'), ns=(50, 100, 200, 300, 400, 500), bs=32, features=8, reps=5, learned=False):
+    ''' Compare the fused and sequential evaluation of a ComboAdjacency '''
+    cuda = torch.cuda.is_available()
+    Combo = LearnedComboAdjacency if learned else ComboAdjacency
+    combo = Combo(adj_list=list(adj_list), dim_in=features, symmetric=False, act='mask', wn=False, alpha=1, R=1)
+    if cuda:
+        combo = combo.cuda()
+    print("{:>6}{:>16}{:>14}{:>12}".format('N', 'sequential (ms)', 'fused (ms)', 'max diff'))
+    for n in ns:
+        x = torch.randn(bs, n, features)
+        if cuda:
+            x = x.cuda()
+        h = Variable(x)
+        timings, outputs = [], []
+        for fused in [False, True]:
+            combo.fused = fused
+            combo(h, None)
+            if cuda: torch.cuda.synchronize()
+            t = time.time()
+            for _ in range(reps):
+                out = combo(h, None)
+            if cuda: torch.cuda.synchronize()
+            timings.append(1000 * (time.time() - t) / reps)
+            outputs.append(out.data)
+        print("{:>6}{:>16.1f}{:>14.1f}{:>12.2e}".format(n, timings[0], timings[1], (outputs[0] - outputs[1]).abs().max()))
+    combo.fused = True
+
+if __name__ == '__main__':
+    time_combo()
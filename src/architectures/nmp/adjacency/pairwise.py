@@ -0,0 +1,199 @@
+import math
+import time
+
+import torch
+from torch.autograd import Variable
+
+'''
+Pairwise kernels shared by the adjacencies in simple/.
+
+None of them broadcasts vertices to (batch_size) * N * N * D:
+    squared and Euclidean distances come from the Gram matrix,
+        |h_i - h_j|^2 = |h_i|^2 + |h_j|^2 - 2 h_i.h_j
+    of the centered vertices, except for the pairs so close that the
+    expansion cancels out (the diagonal among them), which are recomputed
+    from their differences
+    a linear function of h_i + h_j is the sum of per-vertex projections
+    (eta, phi) distances only take two coordinates per vertex
+Whatever remains (batch_size) * N * N is evaluated for a chunk of rows at a
+time, so that the temporaries of one chunk stay under MAX_CHUNK_MB.
+'''
+
+MAX_CHUNK_MB = 256
+
+def row_chunks(n, bytes_per_row, max_mb=None):
+    if max_mb is None:
+        max_mb = MAX_CHUNK_MB
+    size = max(1, int(max_mb * 2 ** 20 // max(bytes_per_row, 1)))
+    return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+def pairwise(rows_fn, x, n_temporaries=4, max_mb=None):
+    '''
+    Concatenate rows_fn(start, end), the (batch_size) * (end - start) * N
+    block of a pairwise matrix, over row chunks. n_temporaries is the number
+    of float (batch_size) * N rows rows_fn allocates per row of output.
+    '''
+    bs, n = x.size()[:2]
+    chunks = row_chunks(n, n_temporaries * 4 * bs * n, max_mb)
+    if len(chunks) == 1:
+        return rows_fn(0, n)
+    return torch.cat([rows_fn(start, end) for start, end in chunks], 1)
+
+def refine_close_pairs(d2, h_rows, h, sq_rows, sq, rtol=1e-3):
+    '''
+    Recompute from h_i - h_j the entries of a (batch_size) * r * N block of
+    Gram squared distances that are below rtol * (sq_i + sq_j), the squared
+    norms the expansion was computed from, where it has lost most of its
+    digits.
+    '''
+    bs, r, n = d2.size()
+    close = d2.data <= rtol * (sq_rows.data.unsqueeze(2) + sq.data.unsqueeze(1))
+    bij = close.nonzero()
+    if bij.numel() == 0:
+        return d2
+    b, i, j = bij[:, 0], bij[:, 1], bij[:, 2]
+    idx = (b * r + i) * n + j
+    dim = h.size(2)
+    diff = h_rows.contiguous().view(-1, dim).index_select(0, Variable(b * r + i)) - h.contiguous().view(-1, dim).index_select(0, Variable(b * n + j))
+    exact = (diff ** 2).sum(1)
+    far = Variable(1 - close.type_as(d2.data))
+    return (d2 * far).view(-1).index_add(0, Variable(idx), exact).view(bs, r, n)
+
+def squared_distances(h, max_mb=None):
+    ''' (batch_size) * N * N matrix of |h_i - h_j|^2, exactly zero at i == j '''
+    # distances do not depend on the origin, and centering shrinks the norms
+    # the expansion cancels; close pairs are recomputed from h itself, so that
+    # their differences are exactly those of the broadcast kernel
+    c = h - h.mean(1, keepdim=True)
+    sq = (c ** 2).sum(2)
+    def rows_fn(start, end):
+        gram = torch.bmm(c[:, start:end], c.transpose(1, 2))
+        # rounding can take the Gram expansion slightly below zero
+        d2 = (sq[:, start:end].unsqueeze(2) + sq.unsqueeze(1) - 2 * gram).clamp(min=0)
+        return refine_close_pairs(d2, h[:, start:end], h, sq[:, start:end], sq)
+    return pairwise(rows_fn, h, 4, max_mb)
+
+def safe_sqrt(d2):
+    ''' Square root of non-negative d2, with a zero gradient (not nan) where d2 is zero '''
+    zero = Variable((d2.data <= 0).type_as(d2.data))
+    return ((d2 + zero) ** 0.5) * (1 - zero)
+
+def euclidean_distances(h, max_mb=None):
+    ''' (batch_size) * N * N matrix of |h_i - h_j|, with a zero gradient at i == j '''
+    return safe_sqrt(squared_distances(h, max_mb))
+
+def pairwise_sum(s_rows, s_cols):
+    ''' (batch_size) * r * c matrix of s_rows[i] + s_cols[j] '''
+    return s_rows.unsqueeze(2) + s_cols.unsqueeze(1)
+
+def delta_eta_phi(p_rows, p_cols):
+    ''' (batch_size) * r * c differences in eta and phi, stored in columns 1 and 2 '''
+    delta_eta = p_cols[:, :, 1].unsqueeze(1) - p_rows[:, :, 1].unsqueeze(2)
+    delta_phi = p_cols[:, :, 2].unsqueeze(1) - p_rows[:, :, 2].unsqueeze(2)
+    delta_phi = torch.remainder(delta_phi + math.pi, 2 * math.pi) - math.pi
+    return delta_eta, delta_phi
+
+def pairwise_delta_r(p_rows, p_cols):
+    delta_eta, delta_phi = delta_eta_phi(p_rows, p_cols)
+    return (delta_phi ** 2 + delta_eta ** 2) ** 0.5
+
+def pairwise_min(a_rows, a_cols):
+    ''' (batch_size) * r * c matrix of min(a_rows[i], a_cols[j]) '''
+    shape = (a_rows.size(0), a_rows.size(1), a_cols.size(1))
+    return torch.min(a_rows.unsqueeze(2).expand(*shape), a_cols.unsqueeze(1).expand(*shape))
+
+class PairwiseTerms:
+    '''
+    Pairwise quantities of one batch of vertices, computed on first use and
+    then shared by every adjacency evaluated on the same vertices (see
+    ComboAdjacency).
+    '''
+    def __init__(self, h, max_mb=None):
+        self.h = h
+        self.max_mb = max_mb
+        self.cache = {}
+
+    def get(self, name, fn):
+        if name not in self.cache:
+            self.cache[name] = fn()
+        return self.cache[name]
+
+    def squared_distances(self):
+        return self.get('squared_distances', lambda: squared_distances(self.h, self.max_mb))
+
+    def euclidean_distances(self):
+        return self.get('euclidean_distances', lambda: safe_sqrt(self.squared_distances()))
+
+    def delta_r(self):
+        rows_fn = lambda start, end: pairwise_delta_r(self.h[:, start:end], self.h)
+        return self.get('delta_r', lambda: pairwise(rows_fn, self.h, 5, self.max_mb))
+
+def _broadcast_squared_distances(h):
+    # the former NegativeSquare kernel, kept as a reference
+    shp = h.size()
+    h_l = h.unsqueeze(1).repeat(1, shp[1], 1, 1)
+    h_r = h.unsqueeze(2).repeat(1, 1, shp[1], 1)
+    return torch.sum((h_l - h_r) ** 2, 3)
+
+def _broadcast_euclidean_distances(h):
+    # the former NegativeNorm kernel, kept as a reference
+    shp = h.size()
+    return torch.norm(h.view(shp[0], shp[1], 1, shp[2]) - h.view(shp[0], 1, shp[1], shp[2]), 2, 3)
+
+def _broadcast_dij(p, alpha=1, R=1):
+    # the former compute_dij, kept as a reference
+    p1 = p.unsqueeze(1) + 1e-10
+    p2 = p.unsqueeze(2) + 1e-10
+    delta_eta = p1[:,:,:,1] - p2[:,:,:,1]
+    delta_phi = p1[:,:,:,2] - p2[:,:,:,2]
+    delta_phi = torch.remainder(delta_phi + math.pi, 2*math.pi) - math.pi
+    delta_r = (delta_phi**2 + delta_eta**2)**0.5
+    return torch.min(p1[:,:,:,0]**(2.*alpha), p2[:,:,:,0]**(2.*alpha)) * delta_r / R
+
+def time_pairwise(ns=(50, 100, 200, 300, 400, 500), bs=32, hidden=64, reps=3):
+    '''
+    Compare the kernels with the broadcasting formulations they replace:
+    time and, on a GPU with a torch that can reset peaks, peak memory of forward and backward, and the largest
+    difference in values and gradients.
+    '''
+    from .simple.physics import compute_dij
+    cuda = torch.cuda.is_available()
+    # peaks can only be compared if they can be reset between kernels
+    measure_memory = cuda and hasattr(torch.cuda, 'reset_max_memory_allocated')
+    kernels = [
+        ('phy', _broadcast_dij, lambda p: compute_dij(p, 1, 1)),
+        ('sq', _broadcast_squared_distances, squared_distances),
+        ('norm', _broadcast_euclidean_distances, euclidean_distances),
+    ]
+    print("{:>6}{:>6}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}".format(
+        'kernel', 'N', 'old (ms)', 'new (ms)', 'old (MB)', 'new (MB)', 'max diff', 'grad diff'))
+    for n in ns:
+        x = torch.randn(bs, n, hidden)
+        if cuda:
+            x = x.cuda()
+        for name, old, new in kernels:
+            results = []
+            for fn in [old, new]:
+                if cuda:
+                    torch.cuda.synchronize()
+                if measure_memory:
+                    torch.cuda.reset_max_memory_allocated()
+                    base = torch.cuda.memory_allocated()
+                t = time.time()
+                for _ in range(reps):
+                    h = Variable(x, requires_grad=True)
+                    A = fn(h)
+                    A.sum().backward()
+                if cuda:
+                    torch.cuda.synchronize()
+                peak = (torch.cuda.max_memory_allocated() - base) / 2 ** 20 if measure_memory else float('nan')
+                results.append((1000 * (time.time() - t) / reps, peak, A.data, h.grad.data))
+            (t_old, m_old, A_old, g_old), (t_new, m_new, A_new, g_new) = results
+            # delta R is not differentiable at i == j, where both give nan
+            grad_diff = (g_old - g_new).abs()
+            grad_diff[grad_diff != grad_diff] = 0
+            print("{:>6}{:>6}{:>12.1f}{:>12.1f}{:>12.1f}{:>12.1f}{:>12.2e}{:>12.2e}".format(
+                name, n, t_old, t_new, m_old, m_new, (A_old - A_new).abs().max(), grad_diff.max()))
+
+if __name__ == '__main__':
+    time_pairwise()
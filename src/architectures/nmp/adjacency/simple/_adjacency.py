@@ -3,6 +3,7 @@ import torch.nn as nn
 from src.monitors import Histogram
 from src.monitors import BatchMatrixMonitor
 from .matrix_activation import MATRIX_ACTIVATIONS
+from ..sparse import EdgeList, SPARSE_ACTIVATIONS, select_edges
 
 class _Adjacency(nn.Module):
     def __init__(self, **kwargs):
@@ -20,6 +21,7 @@ class _Adjacency(nn.Module):
         self.name = name
         self.symmetric = symmetric
         self.activation = MATRIX_ACTIVATIONS[act]
+        self.act = act
 
 
     def set_monitors(self):
@@ -31,12 +33,36 @@ class _Adjacency(nn.Module):
         for m in self.monitors: m.initialize(None, logger.plotsdir)
         self.logging_frequency = logging_frequency
 
-    def raw_matrix(self, h):
+    def raw_matrix(self, h, terms=None):
+        ''' terms: PairwiseTerms of h shared with other adjacencies, or None '''
         pass
 
-    def forward(self, h, mask, **kwargs):
+    def raw_edges(self, h, dst, src):
+        ''' Values of raw_matrix at the given edges of the flattened batch '''
+        raise NotImplementedError("{} has no sparse mode".format(type(self).__name__))
+
+    def edge_values(self, h, dst, src, n_nodes):
+        ''' Values of forward at the given edges of the flattened batch '''
+        values = self.raw_edges(h, dst, src)
+        if self.symmetric:
+            values = 0.5 * (values + self.raw_edges(h, src, dst))
+        if self.act is not None:
+            values = SPARSE_ACTIVATIONS[self.act](values, dst, n_nodes)
+        return values
+
+    def sparse_forward(self, h, mask=None, k=None, radius=None, **kwargs):
+        '''
+        EdgeList counterpart of forward, evaluated on the k nearest neighbours
+        of each vertex (see sparse.select_edges).
+        '''
+        bs, n = h.size()[:2]
+        dst, src = select_edges(h, mask, k, radius)
+        h_flat = h.contiguous().view(bs * n, -1)
+        return EdgeList(dst, src, self.edge_values(h_flat, dst, src, bs * n), (bs, n))
+
+    def forward(self, h, mask, terms=None, **kwargs):
         #import ipdb; ipdb.set_trace()
-        M = self.raw_matrix(h)
+        M = self.raw_matrix(h, terms=terms)
 
         if self.symmetric:
             M = 0.5 * (M + M.transpose(1, 2))
@@ -57,7 +83,10 @@ class _Adjacency(nn.Module):
             #print(self.name)
             #import ipdb; ipdb.set_trace()
             if mask is not None:
-                nonmask_ends = [int(torch.sum(m,0)[0]) for m in mask.data]
+                if mask.dim() == 1:
+                    nonmask_ends = [int(l) for l in mask]
+                else:
+                    nonmask_ends = [int(torch.sum(m,0)[0]) for m in mask.data]
                 dij_hist = [d[:nme, :nme].contiguous().view(-1) for d, nme in zip(dij, nonmask_ends)]
                 dij_hist = torch.cat(dij_hist,0)
             else:
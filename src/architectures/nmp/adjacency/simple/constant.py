@@ -10,7 +10,7 @@ class Ones(_Adjacency):
         name='one'+index
         super().__init__(symmetric=False, activation='mask',name=name, **kwargs)
 
-    def raw_matrix(self, vertices):
+    def raw_matrix(self, vertices, terms=None):
         bs, sz, _ = vertices.size()
         matrix = Variable(torch.ones(bs, sz, sz))
         if torch.cuda.is_available():
@@ -21,6 +21,9 @@ class Ones(_Adjacency):
         #    return matrix
         #return mask * matrix
 
+    def raw_edges(self, h, dst, src):
+        return Variable(h.data.new(len(dst)).fill_(1))
+
 class Eye(_Adjacency):
     def __init__(self, index='',**kwargs):
         kwargs.pop('symmetric', None)
@@ -28,7 +31,7 @@ class Eye(_Adjacency):
         name='eye'+index
         super().__init__(symmetric=False, activation='mask',name=name, **kwargs)
 
-    def raw_matrix(self, vertices):
+    def raw_matrix(self, vertices, terms=None):
         bs, sz, _ = vertices.size()
         matrix = Variable(torch.eye(sz).unsqueeze(0).repeat(bs, 1, 1))
         if torch.cuda.is_available():
@@ -38,6 +41,9 @@ class Eye(_Adjacency):
         #    return matrix
         #return mask * matrix
 
+    def raw_edges(self, h, dst, src):
+        return Variable(dst.eq(src).type_as(h.data))
+
 CONSTANT_ADJACENCIES = dict(
     one=Ones,
     eye=Eye
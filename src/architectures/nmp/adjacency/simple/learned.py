@@ -1,8 +1,11 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.autograd import Variable
 from src.architectures.embedding import EMBEDDINGS
+from src.data_ops.masks import apply_mask
 from ._adjacency import _Adjacency
+from ..pairwise import pairwise_sum, squared_distances, euclidean_distances, safe_sqrt
 
 class Sum(_Adjacency):
     def __init__(self, dim_in, index='',**kwargs):
@@ -13,13 +16,17 @@ class Sum(_Adjacency):
         if kwargs['wn']:
             self.edge_embedding = nn.utils.weight_norm(self.edge_embedding, name='weight')
 
-    def raw_matrix(self, h):
-        shp = h.size()
-        h_l = h.view(shp[0], shp[1], 1, shp[2])
-        h_r = h.view(shp[0], 1, shp[1], shp[2])
-        A = self.edge_embedding(h_l + h_r).squeeze(-1)
+    def raw_matrix(self, h, terms=None):
+        # edge_embedding(h_i + h_j) = edge_embedding(h_i) + edge_embedding(h_j) - bias
+        s = self.edge_embedding(h).squeeze(-1)
+        A = pairwise_sum(s, s) - self.edge_embedding.bias
         return -A
 
+    def raw_edges(self, h, dst, src):
+        h_l = h.index_select(0, Variable(dst))
+        h_r = h.index_select(0, Variable(src))
+        return -self.edge_embedding(h_l + h_r).squeeze(-1)
+
 
 class DistMult(_Adjacency):
     def __init__(self, dim_in, index='', **kwargs):
@@ -30,30 +37,62 @@ class DistMult(_Adjacency):
         if kwargs['wn']:
             self = nn.utils.weight_norm(self, name='matrix')
 
-    def raw_matrix(self, vertices):
+    def raw_matrix(self, vertices, terms=None):
         h = vertices
         A = torch.matmul(h, torch.matmul(self.matrix, h.transpose(1,2)))
         return A
 
+    def raw_edges(self, h, dst, src):
+        h_l = h.index_select(0, Variable(dst))
+        h_r = h.index_select(0, Variable(src))
+        return (torch.matmul(h_l, self.matrix) * h_r).sum(1)
+
 
 class Attentional(_Adjacency):
-    def __init__(self, dim_in, dim_out=None, index='', **kwargs):
+    '''
+    e_ij = a . [h_i, h_j] = a_left . h_i + a_right . h_j, computed as two
+    (batch_size) * N projections added by broadcasting, so that no
+    (batch_size) * N * N * D tensor is built.
+
+    With n_heads > 1, each head has its own a and the scores of the heads are
+    averaged. Like the single-head score, and the concatenated score before
+    it, the average stays linear, so the heads only change how the score is
+    parametrized. Padded vertices get a score of zero.
+    '''
+    def __init__(self, dim_in, dim_out=None, index='', n_heads=1, **kwargs):
         name='attn'+index
         super().__init__(name=name,**kwargs)
         if dim_out is None: dim_out = dim_in
+        self.dim_out = dim_out
+        self.n_heads = n_heads
         self.embedding = EMBEDDINGS['n'](dim_in=dim_in, dim_out=dim_out, n_layers=2, act='leakyrelu')
-        self.a = nn.Parameter(torch.zeros(1, 1,1, 2 * dim_out))
+        self.a = nn.Parameter(torch.zeros(n_heads, 1,1, 2 * dim_out))
         nn.init.xavier_normal(self.a)
 
-    def forward(self, h=None, **kwargs):
+    def scores(self, h):
+        ''' (batch_size) * n_heads * N * N scores of the embedded vertices h '''
+        a = self.a.view(self.n_heads, 2 * self.dim_out)
+        s_left = torch.matmul(h, a[:, :self.dim_out].t()).transpose(1, 2)
+        s_right = torch.matmul(h, a[:, self.dim_out:].t()).transpose(1, 2)
+        return s_left.unsqueeze(3) + s_right.unsqueeze(2)
+
+    def combine_heads(self, e, dim):
+        return e.mean(dim)
+
+    def forward(self, h=None, mask=None, **kwargs):
         h = self.embedding(h)
-        shp = h.size()
-        h_i = h.view(shp[0], shp[1], 1, shp[2]).repeat(1, 1, shp[1], 1)
-        h_j = h.view(shp[0], 1, shp[1], shp[2]).repeat(1, shp[1], 1, 1)
-        h_cat = torch.cat([h_i,h_j], 3)
-        e_ij = torch.sum(h_cat * self.a, 3)
+        e_ij = self.combine_heads(self.scores(h), 1)
+
+        return apply_mask(e_ij, mask)
 
-        return e_ij
+    def edge_values(self, h, dst, src, n_nodes):
+        # like forward, the scores are used as they are
+        h = self.embedding(h)
+        a = self.a.view(self.n_heads, 2 * self.dim_out)
+        s_left = torch.matmul(h, a[:, :self.dim_out].t())
+        s_right = torch.matmul(h, a[:, self.dim_out:].t())
+        e = s_left.index_select(0, Variable(dst)) + s_right.index_select(0, Variable(src))
+        return self.combine_heads(e, 1)
 
 class NegativeNorm(_Adjacency):
     def __init__(self, index='',**kwargs):
@@ -61,12 +100,14 @@ class NegativeNorm(_Adjacency):
         super().__init__(name=name,**kwargs)
         #self.softmax = PaddedMatrixSoftmax()
 
-    def raw_matrix(self, h):
-        shp = h.size()
-        h_l = h.view(shp[0], shp[1], 1, shp[2])
-        h_r = h.view(shp[0], 1, shp[1], shp[2])
-        A = torch.norm(h_l - h_r, 2, 3)
+    def raw_matrix(self, h, terms=None):
+        A = euclidean_distances(h) if terms is None else terms.euclidean_distances()
         return -A
+
+    def raw_edges(self, h, dst, src):
+        h_l = h.index_select(0, Variable(dst))
+        h_r = h.index_select(0, Variable(src))
+        return -safe_sqrt(((h_l - h_r) ** 2).sum(1))
         #A = F.sigmoid(A)
         #if mask is None:
         #    return A
@@ -79,18 +120,15 @@ class NegativeSquare(_Adjacency):
         self.temperature = temperature
 
 
-    def raw_matrix(self, h):
-        shp = h.size()
-        h_l = h.unsqueeze(1).repeat(1, shp[1], 1, 1)
-        h_r = h.unsqueeze(2).repeat(1, 1, shp[1], 1)
-        #h_r = h.view(shp[0], 1, shp[1], shp[2])
-        A = torch.sum((h_l - h_r)**2, 3)
-
-        del h_l
-        del h_r
-
+    def raw_matrix(self, h, terms=None):
+        A = squared_distances(h) if terms is None else terms.squared_distances()
         return -A / self.temperature
 
+    def raw_edges(self, h, dst, src):
+        h_l = h.index_select(0, Variable(dst))
+        h_r = h.index_select(0, Variable(src))
+        return -((h_l - h_r) ** 2).sum(1) / self.temperature
+
 LEARNED_ADJACENCIES = dict(
     sum=Sum,
     dm=DistMult,
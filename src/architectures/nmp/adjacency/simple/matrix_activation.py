@@ -1,12 +1,13 @@
 import torch
 import torch.nn.functional as F
+from src.data_ops.masks import apply_mask
 
 
 def padded_matrix_softmax(matrix, mask):
     '''
     Inputs:
         matrix <- (batch_size) * M * M tensor that has been padded
-        mask <- (batch_size * M * M) with zeros to mask out the fictitious nodes
+        mask <- (batch_size) lengths, or (batch_size * M * M) with zeros to mask out the fictitious nodes
     Output:
         S <- (batch_size) * M * M tensor, where S[n, i] is a probability distribution over the
             values 1, ..., M. The softmax is taken over each row of the
@@ -16,7 +17,7 @@ def padded_matrix_softmax(matrix, mask):
     #S = F.softmax(matrix.transpose(0, -1)).transpose(0, -1)
     S = F.softmax(matrix, dim=2)
     if mask is not None:
-        S = S * mask
+        S = apply_mask(S, mask)
         Z = S.sum(2, keepdim=True) + 1e-10
         S = S / Z
     return S
@@ -25,7 +26,7 @@ def masked_function(fn):
     def masked(matrix, mask):
         if mask is None:
             return fn(matrix)
-        return fn(matrix) * mask
+        return apply_mask(fn(matrix), mask)
     return masked
 
 def no_mask_softmax(matrix, mask):
@@ -1,10 +1,10 @@
-import math
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torch.autograd import Variable
 
 from ._adjacency import _Adjacency
+from ..pairwise import pairwise, pairwise_delta_r, pairwise_min
 
 
 def construct_physics_adjacency(alpha=None, R=None, trainable_physics=False):
@@ -16,18 +16,28 @@ def construct_physics_adjacency(alpha=None, R=None, trainable_physics=False):
         return FixedPhysicsAdjacency(alpha=alpha, R=R)
 
 
-def compute_dij(p, alpha, R):
-    p1 = p.unsqueeze(1) + 1e-10
-    p2 = p.unsqueeze(2) + 1e-10
+def compute_dij(p, alpha, R, max_mb=None, delta_r=None):
+    p = p + 1e-10
+    pt = p[:,:,0]**(2.*alpha)
 
-    delta_eta = p1[:,:,:,1] - p2[:,:,:,1]
+    if delta_r is not None:
+        # delta R shared with other adjacencies, see PairwiseTerms
+        return pairwise_min(pt, pt) * delta_r / R
 
-    delta_phi = p1[:,:,:,2] - p2[:,:,:,2]
-    delta_phi = torch.remainder(delta_phi + math.pi, 2*math.pi) - math.pi
+    def rows_fn(start, end):
+        delta_r = pairwise_delta_r(p[:, start:end], p)
+        return pairwise_min(pt[:, start:end], pt) * delta_r / R
 
-    delta_r = (delta_phi**2 + delta_eta**2)**0.5
+    return pairwise(rows_fn, p, 6, max_mb)
 
-    dij = torch.min(p1[:,:,:,0]**(2.*alpha), p2[:,:,:,0]**(2.*alpha)) * delta_r / R
+def compute_edge_dij(p, dst, src, alpha, R):
+    ''' compute_dij at the given edges of a flattened (n_nodes) * F batch '''
+    p1 = p.index_select(0, Variable(src)) + 1e-10
+    p2 = p.index_select(0, Variable(dst)) + 1e-10
+
+    delta_r = pairwise_delta_r(p2.unsqueeze(1), p1.unsqueeze(1)).view(-1)
+
+    dij = torch.min(p1[:,0]**(2.*alpha), p2[:,0]**(2.*alpha)) * delta_r / R
 
     return dij
 
@@ -43,12 +53,16 @@ class _PhysicsAdjacency(_Adjacency):
     def R(self):
         pass
 
-    def raw_matrix(self, p, mask=None, **kwargs):
-        dij = compute_dij(p, self.alpha, self.R)
+    def raw_matrix(self, p, mask=None, terms=None, **kwargs):
+        delta_r = None if terms is None else terms.delta_r()
+        dij = compute_dij(p, self.alpha, self.R, delta_r=delta_r)
         #dij = torch.exp(-dij)
         #import ipdb; ipdb.set_trace()
         return -dij
 
+    def raw_edges(self, p, dst, src):
+        return -compute_edge_dij(p, dst, src, self.alpha, self.R)
+
 
 class FixedPhysicsAdjacency(_PhysicsAdjacency):
     def __init__(self, alpha=None, R=None,index='',**kwargs):
@@ -7,6 +7,7 @@ from .vertex_update import VERTEX_UPDATES
 from src.architectures.embedding import EMBEDDINGS
 from src.architectures.embedding import ACTIVATIONS
 from src.architectures.nmp.adjacency import construct_adjacency
+from src.architectures.nmp.adjacency.sparse import propagate
 
 class MessagePassingLayer(nn.Module):
     def __init__(self, hidden=None, update=None, message=None, act=None, **kwargs):
@@ -20,7 +21,7 @@ class MessagePassingLayer(nn.Module):
 
 
     def forward(self, h=None, A=None):
-        message = self.activation(torch.matmul(A, self.message(h)))
+        message = self.activation(propagate(A, self.message(h)))
         h = self.vertex_update(h, message)
         del message
         return h
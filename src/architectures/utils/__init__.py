@@ -2,3 +2,4 @@ from .attention import Attention
 from .any_batch_gru_cell import AnyBatchGRUCell
 from .bidirectional_tree_gru import BiDirectionalTreeGRU
 from .bottle import BottleLinear
+from .checkpoint import run_layers
@@ -0,0 +1,36 @@
+import torch
+from torch.utils.checkpoint import checkpoint
+
+def run_layers(layers, step, state, inputs=(), every=None):
+    '''
+    Run state = step(layer, state, inputs) for each layer in turn, state and
+    inputs being tuples of tensors.
+
+    With every = k and gradients enabled, the layers run in segments of k
+    under activation checkpointing: only the state entering each segment is
+    kept for backward, and the segment is recomputed during backward.
+    Anything a step reads besides its state (an adjacency matrix, say) must
+    be passed in inputs rather than captured, so that its gradient is
+    returned once to the enclosing graph instead of being backpropagated
+    separately by each segment. Tied layers are the same module throughout,
+    and the gradients of each recomputed segment accumulate into it.
+    '''
+    state = tuple(state)
+    inputs = tuple(inputs)
+    if not every or not torch.is_grad_enabled() or not any(x.requires_grad for x in state + inputs):
+        for layer in layers:
+            state = tuple(step(layer, state, inputs))
+        return state
+
+    n_state = len(state)
+    for start in range(0, len(layers), every):
+        segment = layers[start:start + every]
+        def run_segment(*args, segment=segment):
+            segment_state, segment_inputs = args[:n_state], args[n_state:]
+            for layer in segment:
+                segment_state = tuple(step(layer, segment_state, segment_inputs))
+            return segment_state
+        state = checkpoint(run_segment, *(state + inputs))
+        if not isinstance(state, tuple):
+            state = (state,)
+    return state
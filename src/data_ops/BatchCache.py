@@ -0,0 +1,129 @@
+import os
+import logging
+import tempfile
+import collections
+
+import torch
+from torch.autograd import Variable
+
+from .wrapping import to_device
+
+def batch_bytes(batch):
+    if isinstance(batch, (tuple, list)):
+        return sum(batch_bytes(x) for x in batch)
+    if isinstance(batch, Variable):
+        batch = batch.data
+    if torch.is_tensor(batch):
+        return batch.numel() * batch.element_size()
+    return 0
+
+def to_cpu(batch):
+    if isinstance(batch, (tuple, list)):
+        return type(batch)(to_cpu(x) for x in batch)
+    if isinstance(batch, Variable):
+        batch = batch.data
+    if torch.is_tensor(batch):
+        return batch.cpu()
+    return batch
+
+def pin(batch):
+    if isinstance(batch, (tuple, list)):
+        return type(batch)(pin(x) for x in batch)
+    if torch.is_tensor(batch) and torch.cuda.is_available():
+        return batch.pin_memory()
+    return batch
+
+class BatchCache:
+    '''
+    Collates a fixed data set (validation, test) once and replays the batches.
+
+    Batches are kept in memory, on the device if device is True or else in
+    pinned host memory, up to budget megabytes. Past the budget, the least
+    recently used batches are spilled to spill_dir and read back when needed.
+    Iterating over the cache yields device batches, like a _DataLoader, with
+    the loader's augmentation applied afresh.
+    '''
+    def __init__(self, data_loader, budget=1024, device=False, spill_dir=None):
+        self.data_loader = data_loader
+        self.dataset = data_loader.dataset
+        self.budget = budget * 2 ** 20
+        self.device = device
+        self.spill_dir = spill_dir
+        self.resident = collections.OrderedDict()
+        self.resident_bytes = 0
+        self.spilled = set()
+        self.n_batches = None
+        self.indices = None
+
+    def __len__(self):
+        if self.n_batches is None:
+            return len(self.data_loader)
+        return self.n_batches
+
+    def spill_path(self, i):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='batches-')
+        elif not os.path.exists(self.spill_dir):
+            os.makedirs(self.spill_dir)
+        return os.path.join(self.spill_dir, 'batch-{}.pt'.format(i))
+
+    def place(self, batch):
+        return to_device(batch) if self.device else pin(batch)
+
+    def insert(self, i, batch):
+        self.resident[i] = batch
+        self.resident_bytes += batch_bytes(batch)
+        while self.resident_bytes > self.budget and len(self.resident) > 1:
+            j, evicted = self.resident.popitem(last=False)
+            self.resident_bytes -= batch_bytes(evicted)
+            if j not in self.spilled:
+                torch.save(to_cpu(evicted), self.spill_path(j))
+                self.spilled.add(j)
+
+    def fetch(self, i):
+        if i in self.resident:
+            self.resident.move_to_end(i)
+            return self.resident[i]
+        batch = self.place(torch.load(self.spill_path(i)))
+        self.insert(i, batch)
+        return batch
+
+    def fill(self):
+        n = 0
+        for i, batch in enumerate(self.data_loader.cpu_batches()):
+            self.insert(i, self.place(batch))
+            n += 1
+        self.n_batches = n
+        self.indices = self.data_loader.order()
+        logging.info("Cached {} batches: {:.1f}MB resident, {} spilled to disk".format(
+            n, self.resident_bytes / 2 ** 20, len(self.spilled)))
+
+    def clear(self):
+        ''' Forget the collated batches, e.g. when the loader's output changes '''
+        for i in self.spilled:
+            os.remove(self.spill_path(i))
+        self.resident.clear()
+        self.resident_bytes = 0
+        self.spilled = set()
+        self.n_batches = None
+        self.indices = None
+
+    def order(self):
+        ''' Dataset indices in the order the cached batches hold them '''
+        if self.indices is None:
+            return self.data_loader.order()
+        return self.indices
+
+    def __iter__(self):
+        if self.n_batches is None:
+            self.fill()
+        for i in range(self.n_batches):
+            batch = self.fetch(i)
+            if not self.device:
+                batch = to_device(batch)
+            yield self.data_loader.augment(batch)
+
+def cache_batches(data_loader, cache=False, budget=1024, device=False, spill_dir=None):
+    if not cache:
+        return data_loader
+    return BatchCache(data_loader, budget, device, spill_dir)
@@ -0,0 +1,103 @@
+import logging
+import numpy as np
+from torch.utils.data.sampler import Sampler
+
+class BucketBatchSampler(Sampler):
+    '''
+    Batch sampler that groups examples of similar length, so that padding
+    every batch to its longest member wastes little work.
+
+    Each epoch, the examples are shuffled and cut into pools of
+    bucket_size * batch_size. Each pool is sorted by length and cut into
+    batches, and the batches of all pools are shuffled together. If max_n2 is
+    given, a batch also stops growing once batch size * (longest length)^2
+    would exceed it, which bounds the cost of the N^2 adjacency and message
+    passing on long examples.
+
+    With token_budget, batches are not counted in examples at all: each batch
+    grows until its padded cost would exceed the budget, the cost being
+    batch size * (longest length)^2 if budget_mode is 'n2' and
+    batch size * (longest length) if it is 'n'. batch_size then only sets the
+    pool size.
+
+    The plan for the next epoch is made at most once, by whichever of
+    __len__ and __iter__ comes first, so len() is the number of batches the
+    next iteration yields.
+    '''
+    def __init__(self, lengths, batch_size, bucket_size=100, max_n2=None, shuffle=True, token_budget=None, budget_mode='n2'):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.max_n2 = max_n2
+        self.shuffle = shuffle
+        self.token_budget = token_budget
+        self.budget_mode = budget_mode
+        self.batches = None
+        self.next_batches = None
+
+        # what the default sampler would pad, for comparison
+        n = len(self.lengths)
+        self.baseline_efficiency = self.padding_efficiency([np.arange(i, min(i + batch_size, n)) for i in range(0, n, batch_size)])
+
+    def cost(self, batch_size, n):
+        if self.budget_mode == 'n':
+            return batch_size * n
+        return batch_size * n * n
+
+    def plan(self):
+        if self.shuffle:
+            order = np.random.permutation(len(self.lengths))
+        else:
+            order = np.arange(len(self.lengths))
+
+        pool_size = self.bucket_size * self.batch_size
+        batches = []
+        for start in range(0, len(order), pool_size):
+            pool = order[start:start + pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind='mergesort')]
+            batch = []
+            for i in pool:
+                n = self.lengths[i]
+                # pool is sorted, so n is the longest length so far
+                if self.token_budget is None:
+                    full = len(batch) == self.batch_size
+                else:
+                    full = len(batch) > 0 and self.cost(len(batch) + 1, n) > self.token_budget
+                too_big = self.max_n2 is not None and len(batch) > 0 and (len(batch) + 1) * n * n > self.max_n2
+                if full or too_big:
+                    batches.append(batch)
+                    batch = []
+                batch.append(int(i))
+            if len(batch) > 0:
+                batches.append(batch)
+
+        if self.shuffle:
+            batches = [batches[i] for i in np.random.permutation(len(batches))]
+        return batches
+
+    def padding_efficiency(self, batches):
+        ''' Fraction of the padded (batch size * longest length) slots that hold real data '''
+        real = sum(self.lengths[b].sum() for b in batches)
+        padded = sum(len(b) * self.lengths[b].max() for b in batches)
+        return real / max(padded, 1)
+
+    def budget_utilization(self, batches):
+        ''' Mean fraction of token_budget used by the padded batches '''
+        costs = [self.cost(len(b), self.lengths[b].max()) for b in batches]
+        return np.mean(costs) / self.token_budget
+
+    def __iter__(self):
+        self.batches = self.next_batches if self.next_batches is not None else self.plan()
+        self.next_batches = None
+        for batch in self.batches:
+            yield batch
+        logging.info("Padding efficiency {:.1f}% over {} batches (unbucketed {:.1f}%)".format(
+            100 * self.padding_efficiency(self.batches), len(self.batches), 100 * self.baseline_efficiency))
+        if self.token_budget is not None:
+            logging.info("Mean batch size {:.1f}, {} budget utilization {:.1f}%".format(
+                np.mean([len(b) for b in self.batches]), self.budget_mode, 100 * self.budget_utilization(self.batches)))
+
+    def __len__(self):
+        if self.next_batches is None:
+            self.next_batches = self.plan()
+        return len(self.next_batches)
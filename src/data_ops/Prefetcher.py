@@ -0,0 +1,82 @@
+import threading
+import queue
+import torch
+
+from .wrapping import to_device
+
+class Prefetcher:
+    '''
+    Iterates over a _DataLoader while a background thread keeps the next
+    depth batches collated and already on the device. With a GPU, the copies
+    are issued non-blocking on a side stream, and the training stream waits
+    on it before each batch is handed out.
+    '''
+    def __init__(self, data_loader, depth=2):
+        self.data_loader = data_loader
+        self.dataset = data_loader.dataset
+        self.depth = depth
+        self.stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+
+    def __len__(self):
+        return len(self.data_loader)
+
+    def load(self, batches, stop):
+        # put with a timeout, so that a consumer that stopped early (break,
+        # exception) never leaves this thread blocked on a full queue
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for batch in self.data_loader.cpu_batches():
+                if stop.is_set():
+                    return
+                if self.stream is not None:
+                    with torch.cuda.stream(self.stream):
+                        batch = self.data_loader.augment(to_device(batch, non_blocking=True))
+                else:
+                    batch = self.data_loader.augment(to_device(batch))
+                if not put(batch):
+                    return
+        except Exception as e:
+            put(e)
+        put(None)
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=self.load, args=(batches, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                if self.stream is not None:
+                    torch.cuda.current_stream().wait_stream(self.stream)
+                    record_stream(batch, torch.cuda.current_stream())
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+def record_stream(batch, stream):
+    # tell the allocator the side-stream tensors are now used on this stream
+    if isinstance(batch, (tuple, list)):
+        for x in batch:
+            record_stream(x, stream)
+    elif torch.is_tensor(batch) or hasattr(batch, 'record_stream'):
+        batch.record_stream(stream)
+
+def prefetch(data_loader, depth):
+    # cached batches (see BatchCache) are already collated
+    if depth is None or depth < 1 or not hasattr(data_loader, 'cpu_batches'):
+        return data_loader
+    return Prefetcher(data_loader, depth)
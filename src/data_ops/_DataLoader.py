@@ -1,8 +1,48 @@
+import numpy as np
 from torch.utils.data import DataLoader
+from .BucketSampler import BucketBatchSampler
+from .wrapping import to_device
 
 class _DataLoader(DataLoader):
-    def __init__(self, dataset, batch_size):
-        super().__init__(dataset, batch_size, collate_fn=self.collate)
+    '''
+    collate builds CPU tensors only, so it can run in num_workers worker
+    processes (batches come back through shared memory, optionally pinned).
+    Batches are moved to the device as they are handed out.
+    '''
+    def __init__(self, dataset, batch_size, bucket_size=None, max_n2=None, num_workers=0, pin_memory=False, token_budget=None, budget_mode='n2', shuffle=True):
+        loader_args = dict(collate_fn=self.collate, num_workers=num_workers, pin_memory=pin_memory)
+        self.shuffle = shuffle
+        if token_budget is not None and bucket_size is None:
+            bucket_size = 100
+        if bucket_size is not None:
+            batch_sampler = BucketBatchSampler(dataset.lengths(), batch_size, bucket_size, max_n2, shuffle=shuffle, token_budget=token_budget, budget_mode=budget_mode)
+            super().__init__(dataset, batch_sampler=batch_sampler, **loader_args)
+        else:
+            super().__init__(dataset, batch_size, shuffle=shuffle, **loader_args)
+
+    def order(self):
+        '''
+        Dataset indices in the order the last iteration yielded them, to line
+        up per-example quantities (e.g. weights) with the batches
+        '''
+        if isinstance(self.batch_sampler, BucketBatchSampler):
+            batches = self.batch_sampler.batches
+            if batches is None:
+                batches = self.batch_sampler.plan()
+            return np.concatenate([np.asarray(b, dtype=np.int64) for b in batches]) if len(batches) > 0 else np.zeros(0, dtype=np.int64)
+        assert not self.shuffle, "the order of a shuffled loader is not recorded"
+        return np.arange(len(self.dataset))
+
+    def cpu_batches(self):
+        return super().__iter__()
+
+    def augment(self, batch):
+        ''' Random augmentation of a batch that is already on the device '''
+        return batch
+
+    def __iter__(self):
+        for batch in self.cpu_batches():
+            yield self.augment(to_device(batch))
 
     def collate(self, xy_pairs):
         X = self.preprocess_x([x for x, _ in xy_pairs])
@@ -1,12 +1,48 @@
-
 import torch
+from torch.autograd import Variable
+
+def augment_padded(data, lengths, keep_probability=None, permute=False):
+    '''
+    Particle dropout and permutation of a whole padded batch at once, on
+    whatever device the batch is on.
+        data <- (batch_size) * N * (F + 1) padded batch, last channel flags padding
+        lengths <- (batch_size) number of real rows
+    Each real row is kept with probability keep_probability, with at least
+    one survivor per example. The kept rows are moved to the front, in random
+    order if permute, and the batch is trimmed to the longest survivor set.
+    Returns the new (data, lengths).
+    '''
+    is_variable = isinstance(data, Variable)
+    if is_variable:
+        data = data.data
+    bs, n, dim = data.size()
+
+    positions = torch.arange(0, n).type_as(lengths).unsqueeze(0).expand(bs, n)
+    keep = (positions < lengths.unsqueeze(1)).type_as(data)
+
+    if keep_probability is not None:
+        keep = keep * data.new(bs, n).bernoulli_(keep_probability)
+        # make sure every example keeps one of its rows, picked uniformly
+        empty = (keep.sum(1) == 0).type_as(data)
+        pick = (data.new(bs).uniform_() * lengths.type_as(data)).long().clamp(max=n - 1)
+        fix = data.new(bs, n).zero_().scatter_(1, pick.unsqueeze(1), 1)
+        keep = keep + fix * empty.unsqueeze(1)
+
+    if permute:
+        keys = data.new(bs, n).uniform_() + 2 * (1 - keep)
+    else:
+        keys = positions.type_as(data) + n * (1 - keep)
+    _, order = torch.sort(keys, 1)
+    data = torch.gather(data, 1, order.unsqueeze(2).expand(bs, n, dim))
+
+    lengths = keep.sum(1).long()
+    n_max = int(lengths.max())
+    data = data[:, :n_max].contiguous()
 
-def dropout(tensor_list, dropout_probability):
-    data_dim = tensor_list[0].size()[1]
-    for i, x in enumerate(tensor_list):
-        dm = torch.bernoulli(torch.zeros(x.shape[0]).fill_(dropout_probability)).byte()
-        while dm.sum() == 0:
-            dm = torch.bernoulli(torch.zeros(x.shape[0]).fill_(dropout_probability)).byte()
-        tensor_list[i] = torch.masked_select(tensor_list[i], dm.unsqueeze(1).repeat(1, tensor_list[i].shape[1])).view(-1, data_dim)
+    padding = (positions[:, :n_max] >= lengths.unsqueeze(1)).type_as(data)
+    data = data * (1 - padding).unsqueeze(2)
+    data[:, :, -1] = padding
 
-    return tensor_list
+    if is_variable:
+        data = Variable(data)
+    return data, lengths
@@ -0,0 +1,33 @@
+import torch
+from torch.autograd import Variable
+
+'''
+Padding masks built from per-example lengths.
+
+Batches carry a (batch_size) vector of lengths instead of a dense
+(batch_size) * N * N mask. Code that needs the mask calls these functions,
+which build it on whatever device the lengths live on, as a Variable so it
+can be combined with activations. Dense masks are still accepted wherever a
+mask is, so callers can pass either.
+'''
+
+def length_mask(lengths, n):
+    ''' (batch_size) lengths -> (batch_size) * n float mask, 1 on the real entries '''
+    data = lengths.data if isinstance(lengths, Variable) else lengths
+    positions = torch.arange(0, n).type_as(data).unsqueeze(0)
+    mask = (positions < data.unsqueeze(1)).float()
+    return Variable(mask)
+
+def square_mask(lengths, n):
+    ''' (batch_size) lengths -> (batch_size) * n * n float mask '''
+    mask = length_mask(lengths, n)
+    return mask.unsqueeze(2) * mask.unsqueeze(1)
+
+def apply_mask(matrix, mask):
+    ''' Zero the padded rows and columns of a (batch_size) * n * n matrix '''
+    if mask is None:
+        return matrix
+    if mask.dim() == 1:
+        mask = length_mask(mask, matrix.size(1))
+        return matrix * mask.unsqueeze(2) * mask.unsqueeze(1)
+    return matrix * mask
@@ -19,15 +19,10 @@ def pad_tensors_extra_channel(tensor_list):
             padded_data[i, len(x):, -1] = 1
     #padded_data = wrap(padded_data)
 
-    mask = torch.ones(len(data), max_seq_length, max_seq_length)
-    for i, x in enumerate(data):
-        seq_length = len(x)
-        if seq_length < max_seq_length:
-            mask[i, seq_length:, :].fill_(0)
-            mask[i, :, seq_length:].fill_(0)
-    #mask = wrap(mask)
+    # the N * N mask is rebuilt from the lengths where it is needed (see masks.py)
+    lengths = torch.LongTensor(seq_lengths)
 
-    return (padded_data, mask)
+    return (padded_data, lengths)
 
 def pad_tensors(tensor_list):
     data = tensor_list
@@ -49,15 +44,10 @@ def pad_tensors(tensor_list):
         #    padded_data[i, len(x):, -1] = 1
     #padded_data = wrap(padded_data)
 
-    mask = torch.ones(len(data), max_seq_length, max_seq_length)
-    for i, x in enumerate(data):
-        seq_length = len(x)
-        if seq_length < max_seq_length:
-            mask[i, seq_length:, :].fill_(0)
-            mask[i, :, seq_length:].fill_(0)
-    #mask = wrap(mask)
+    # the N * N mask is rebuilt from the lengths where it is needed (see masks.py)
+    lengths = torch.LongTensor(seq_lengths)
 
-    return (padded_data, mask)
+    return (padded_data, lengths)
     
 def pad_matrices(mask_list):
     data = mask_list
@@ -0,0 +1,43 @@
+import collections
+import multiprocessing
+
+def default_n_workers(n_workers=None):
+    if n_workers is None or n_workers < 1:
+        return multiprocessing.cpu_count()
+    return n_workers
+
+def chunks(iterable, chunk_size):
+    ''' Group an iterable into lists of at most chunk_size items '''
+    chunk = []
+    for x in iterable:
+        chunk.append(x)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+def parallel_map(fn, iterable, n_workers=None, max_pending=None):
+    '''
+    Ordered map of fn over iterable in a process pool.
+    Unlike Pool.imap, at most max_pending tasks are in flight at once, so a
+    lazily generated iterable is only consumed as fast as results come back
+    and memory stays bounded. Results are yielded in input order, so the
+    output does not depend on the number of workers.
+    '''
+    n_workers = default_n_workers(n_workers)
+    if n_workers == 1:
+        for x in iterable:
+            yield fn(x)
+        return
+
+    if max_pending is None:
+        max_pending = 2 * n_workers
+    pending = collections.deque()
+    with multiprocessing.Pool(n_workers) as pool:
+        for x in iterable:
+            pending.append(pool.apply_async(fn, (x,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while len(pending) > 0:
+            yield pending.popleft().get()
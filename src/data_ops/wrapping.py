@@ -14,3 +14,23 @@ def unwrap(y_wrap):
     else:
         y = y_wrap.data.numpy()
     return y
+
+FLOAT_TYPES = ['torch.FloatTensor', 'torch.DoubleTensor', 'torch.HalfTensor']
+
+def to_device(batch, non_blocking=False):
+    '''
+    Move a collated CPU batch to the device. Nested tuples and lists are
+    handled recursively; float tensors are wrapped as Variables, integer
+    tensors (node ids, positions, lengths) stay plain tensors, anything else
+    is passed through.
+    '''
+    if isinstance(batch, (tuple, list)):
+        return type(batch)(to_device(x, non_blocking) for x in batch)
+    if torch.is_tensor(batch):
+        is_float = batch.type() in FLOAT_TYPES
+        if torch.cuda.is_available():
+            batch = batch.cuda(non_blocking=True) if non_blocking else batch.cuda()
+        if is_float:
+            return Variable(batch)
+        return batch
+    return batch
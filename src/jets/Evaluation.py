@@ -11,9 +11,12 @@ from src.misc.constants import DATASETS
 from src.utils._Evaluation import _Evaluation
 
 from src.data_ops.wrapping import unwrap
+from src.data_ops.Prefetcher import prefetch
+from src.data_ops.BatchCache import cache_batches
 
-from .data_ops.load_dataset import load_test_dataset
+from .data_ops.load_dataset import load_test_dataset, load_scaler
 from .data_ops.JetLoader import JetLoader as DataLoader
+from .data_ops.AdjacencyCache import cache_fixed_adjacency
 from .models import ModelBuilder
 from .Administrator import Administrator
 
@@ -80,13 +83,40 @@ class Evaluation(_Evaluation):
         return admin_args, data_args, computing_args, training_args, optim_args, loading_args
 
 
-    def load_data(self,dataset, data_dir, n_test,  batch_size, pp, **kwargs):
+    def load_data(self,dataset, data_dir, n_test,  batch_size, pp, pp_workers=None, **kwargs):
         intermediate_dir, data_filename = DATASETS[dataset]
         data_dir = os.path.join(data_dir, intermediate_dir)
-        dataset = load_test_dataset(data_dir, data_filename,n_test, redo=pp)
-        data_loader = DataLoader(dataset, batch_size, **kwargs)
+        self.adjacency_dir = os.path.join(data_dir, 'preprocessed', 'adjacency')
+        self.data_dir, self.data_filename = data_dir, data_filename
+        # normalized for each model with its own scaler, see prepare_data
+        dataset = load_test_dataset(data_dir, data_filename,n_test, redo=pp, n_workers=pp_workers, transform=False)
+        data_loader = DataLoader(dataset, batch_size, shuffle=False, **kwargs)
+        data_loader = cache_batches(
+            data_loader,
+            self.data_args.cache_batches,
+            self.data_args.cache_budget,
+            self.data_args.cache_device,
+            self.data_args.cache_dir
+            )
         return data_loader
 
+    def prepare_data(self, model, filename, data_loader):
+        scaler_filename = os.path.join(filename, 'scaler.npz')
+        if not os.path.exists(scaler_filename):
+            logging.warning("{} has no scaler.npz, using the scaler of the full training set".format(filename))
+        tf = load_scaler(self.data_dir, self.data_filename, scaler_filename, self.data_args.pp_workers)
+
+        loader = getattr(data_loader, 'data_loader', data_loader)
+        dataset = loader.dataset
+        if dataset.tf is None or dataset.tf.version != tf.version:
+            dataset.transform(tf, keep_raw=True)
+            # batches collated with another normalization
+            if data_loader is not loader:
+                data_loader.clear()
+
+        if self.data_args.cache_adj:
+            cache_fixed_adjacency(model, [data_loader], self.adjacency_dir)
+
     def loss(self, y_pred, y):
         return F.binary_cross_entropy(y_pred.squeeze(1), y)
 
@@ -95,14 +125,15 @@ class Evaluation(_Evaluation):
         model.eval()
 
         valid_loss = 0.
+        n_examples = 0
         yy, yy_pred = [], []
-        for i, (x, y) in enumerate(data_loader):
+        for i, (x, y) in enumerate(prefetch(data_loader, self.data_args.prefetch)):
             y_pred = model(x)
-            vl = self.loss(y_pred, y); valid_loss += float(unwrap(vl))
+            vl = self.loss(y_pred, y); valid_loss += float(unwrap(vl)) * len(y); n_examples += len(y)
             yv = unwrap(y); y_pred = unwrap(y_pred)
             yy.append(yv); yy_pred.append(y_pred)
 
-        valid_loss /= len(data_loader)
+        valid_loss /= max(n_examples, 1)
         logdict = dict(
             yy=yy,
             yy_pred=yy_pred,
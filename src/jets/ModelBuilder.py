@@ -34,6 +34,7 @@ class ModelBuilder(_ModelBuilder):
             # NMP
             'iters': args.iters,
             'tied': args.tied,
+            'checkpoint_every': args.checkpoint_every,
             'update': args.update,
             'message': args.message,
             'emb_init':args.emb_init,
@@ -42,6 +43,9 @@ class ModelBuilder(_ModelBuilder):
             'readout':args.readout,
             'matrix':args.adj[0] if len(args.adj) == 1 else args.adj,
             'm_act':args.m_act,
+            'adj_sparse':args.adj_sparse,
+            'adj_radius':args.adj_radius,
+            'adj_heads':args.adj_heads,
             'no_grad': args.no_grad,
             'wn': args.wn,
 
@@ -2,6 +2,7 @@ import logging
 import time
 import gc
 import os
+import numpy as np
 #from memory_profiler import profile, memory_usage
 
 import torch
@@ -9,7 +10,10 @@ import torch.nn.functional as F
 
 from .data_ops.load_dataset import load_train_dataset
 from .data_ops.JetLoader import JetLoader as DataLoader
+from .data_ops.AdjacencyCache import cache_fixed_adjacency
 from src.data_ops.wrapping import unwrap
+from src.data_ops.Prefetcher import prefetch
+from src.data_ops.BatchCache import cache_batches
 
 from src.misc.constants import DATASETS
 
@@ -79,14 +83,41 @@ class Training(_Training):
     def load_data(self,dataset, data_dir, n_train, n_valid, batch_size, preprocess, **kwargs):
         intermediate_dir, data_filename = DATASETS[dataset]
         data_dir = os.path.join(data_dir, intermediate_dir)
-        train_dataset, valid_dataset = load_train_dataset(data_dir, data_filename,n_train, n_valid, preprocess)
+        self.adjacency_dir = os.path.join(data_dir, 'preprocessed', 'adjacency')
+        train_dataset, valid_dataset = load_train_dataset(data_dir, data_filename,n_train, n_valid, preprocess, self.data_args.pp_workers)
+
+        # only the recursive nets read jets as trees
+        leaves = self.model_args.model not in ['recs', 'recg']
+
+        loader_args = dict(
+            bucket_size=self.data_args.bucket_size,
+            max_n2=self.data_args.max_n2,
+            num_workers=self.data_args.num_workers,
+            pin_memory=self.data_args.pin_memory,
+            token_budget=self.data_args.token_budget,
+            budget_mode=self.data_args.budget_mode
+            )
+        train_data_loader = DataLoader(train_dataset, batch_size, leaves=leaves, **loader_args, **kwargs)
+        valid_data_loader = DataLoader(valid_dataset, batch_size, leaves=leaves, shuffle=False, **loader_args, **kwargs)
+        valid_data_loader = cache_batches(
+            valid_data_loader,
+            self.data_args.cache_batches,
+            self.data_args.cache_budget,
+            self.data_args.cache_device,
+            self.data_args.cache_dir
+            )
 
-        leaves = self.model_args.model in ['recs', 'recg']
+        return train_data_loader, valid_data_loader
 
-        train_data_loader = DataLoader(train_dataset, batch_size, leaves=leaves,**kwargs)
-        valid_data_loader = DataLoader(valid_dataset, batch_size, leaves=leaves,**kwargs)
+    def prepare_data(self, model, *data_loaders):
+        if self.data_args.cache_adj:
+            cache_fixed_adjacency(model, data_loaders, self.adjacency_dir)
 
-        return train_data_loader, valid_data_loader
+    def save_data_artifacts(self, dataset, exp_dir):
+        dataset.tf.save(os.path.join(exp_dir, 'scaler.npz'))
+
+    def batch_size(self, batch):
+        return len(batch[1])
 
     def loss(self, y_pred, y):
         return F.binary_cross_entropy(y_pred.squeeze(1), y)
@@ -97,10 +128,11 @@ class Training(_Training):
         model.eval()
 
         valid_loss = 0.
+        n_examples = 0
         yy, yy_pred = [], []
-        for i, (x, y) in enumerate(data_loader):
+        for i, (x, y) in enumerate(prefetch(data_loader, self.data_args.prefetch)):
             y_pred = model(x)
-            vl = self.loss(y_pred, y); valid_loss += float(unwrap(vl))
+            vl = self.loss(y_pred, y); valid_loss += float(unwrap(vl)) * self.batch_size((x, y)); n_examples += self.batch_size((x, y))
             yv = unwrap(y); y_pred = unwrap(y_pred)
             yy.append(yv); yy_pred.append(y_pred)
 
@@ -110,7 +142,13 @@ class Training(_Training):
         #    y_pred_matrix_monitor(matrix=y_pred)
         #    y_pred_matrix_monitor.visualize('epoch-{}/{}'.format(epoch, 'y_pred'), n=10)
 
-        valid_loss /= len(data_loader)
+        # batches vary in size under a token budget, so weight by examples
+        valid_loss /= max(n_examples, 1)
+
+        # bucketing reorders the jets, so the weights follow the yielded order
+        w_valid = data_loader.dataset.weights
+        if w_valid is not None:
+            w_valid = np.asarray(w_valid)[data_loader.order()]
 
         t1=time.time()
 
@@ -118,7 +156,7 @@ class Training(_Training):
             yy=yy,
             yy_pred=yy_pred,
             #mask=mask,
-            w_valid=data_loader.dataset.weights,
+            w_valid=w_valid,
             valid_loss=valid_loss,
             model=model,
             logtime=0,
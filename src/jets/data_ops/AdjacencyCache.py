@@ -0,0 +1,146 @@
+import os
+import hashlib
+import logging
+import time
+
+import numpy as np
+import torch
+
+from src.data_ops.pad_tensors import pad_tensors_extra_channel
+from src.data_ops.wrapping import to_device, unwrap
+from src.architectures.nmp.adjacency.simple.physics import FixedPhysicsAdjacency
+from src.architectures.nmp.adjacency.simple.constant import Ones, Eye
+
+'''
+Per-jet cache of fixed adjacency matrices.
+
+FixedPhysicsAdjacency and the one/eye adjacencies have no parameters, so
+their matrix (after activation) is a function of the jet alone. It is
+computed once per jet, kept on the jet as an n * n float32 array, like the
+level schedules of JetLoader, and optionally written to disk as one ragged
+array with offsets. The key of a cached matrix names everything the matrix
+depends on: the adjacency, alpha and R, the activation, symmetrization and
+the version of the scaler that normalized the constituents.
+'''
+
+# activations that act on the valid block alone, so a jet's matrix does not
+# depend on how much the batch around it is padded
+CACHEABLE_ACTIVATIONS = ['mask', 'soft', 'sigmoid', 'exp', 'tanh']
+
+def fixed_adjacency(model):
+    ''' The adjacency of model if it can be cached, else None '''
+    adjacency = getattr(model, 'adjacency_matrix', None)
+    if getattr(model, 'sparse', False):
+        return None
+    if not isinstance(adjacency, (FixedPhysicsAdjacency, Ones, Eye)):
+        return None
+    if adjacency.act not in CACHEABLE_ACTIVATIONS:
+        return None
+    return adjacency
+
+def scaler_version(tf):
+    if tf is None:
+        return 'raw'
+    return tf.version
+
+def cache_key(adjacency, tf=None):
+    parts = [type(adjacency).__name__, adjacency.act]
+    if isinstance(adjacency, FixedPhysicsAdjacency):
+        parts += ['alpha{:g}'.format(float(unwrap(adjacency.alpha)[0])), 'R{:g}'.format(float(unwrap(adjacency.R)[0]))]
+    if adjacency.symmetric:
+        parts.append('sym')
+    parts.append(scaler_version(tf))
+    return '-'.join(parts)
+
+def jets_fingerprint(jets):
+    ''' Identifies a sequence of jets, so that a cache on disk is only reused for the same jets in the same order '''
+    h = hashlib.sha1()
+    h.update(np.array([len(j) for j in jets], dtype=np.int64).tobytes())
+    h.update(np.array([j.pt for j in jets], dtype=np.float64).tobytes())
+    return h.hexdigest()[:12]
+
+def compute_adjacencies(jets, adjacency, batch_size=256):
+    ''' List of the n * n matrices of the jets, evaluated batch_size jets at a time '''
+    matrices = []
+    for start in range(0, len(jets), batch_size):
+        chunk = [jets[i] for i in range(start, min(start + batch_size, len(jets)))]
+        data, lengths = pad_tensors_extra_channel([torch.from_numpy(np.asarray(j.constituents)).float() for j in chunk])
+        data, lengths = to_device((data, lengths))
+        with torch.no_grad():
+            A = unwrap(adjacency(data, mask=lengths))
+        for a, n in zip(A, lengths.cpu().numpy()):
+            matrices.append(np.ascontiguousarray(a[:n, :n], dtype=np.float32))
+    return matrices
+
+def save_adjacencies(path, matrices):
+    if not os.path.exists(path):
+        os.makedirs(path)
+    offsets = np.zeros(len(matrices) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([m.size for m in matrices])
+    values = np.lib.format.open_memmap(os.path.join(path, 'values.npy'), mode='w+', dtype=np.float32, shape=(offsets[-1],))
+    for m, start in zip(matrices, offsets[:-1]):
+        values[start:start + m.size] = m.ravel()
+    values.flush()
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+
+def load_adjacencies(path):
+    values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+    offsets = np.load(os.path.join(path, 'offsets.npy'))
+    matrices = []
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        n = int(round((end - start) ** 0.5))
+        matrices.append(values[start:end].reshape(n, n))
+    return matrices
+
+def attach_adjacencies(jets, adjacency, key, cache_dir=None):
+    '''
+    Make jet.adjacencies[key] the cached matrix of every jet, reading it from
+    cache_dir if it was saved there for the same jets, computing (and then
+    saving) it otherwise.
+    '''
+    if all(key in getattr(j, 'adjacencies', {}) for j in jets):
+        return
+    t = time.time()
+    path = None if cache_dir is None else os.path.join(cache_dir, '{}-{}'.format(key, jets_fingerprint(jets)))
+    if path is not None and os.path.exists(os.path.join(path, 'offsets.npy')):
+        matrices = load_adjacencies(path)
+        logging.info("Loaded {} cached {} adjacencies from {}".format(len(matrices), key, path))
+    else:
+        matrices = compute_adjacencies(jets, adjacency)
+        if path is not None:
+            save_adjacencies(path, matrices)
+        logging.info("Computed {} {} adjacencies in {:.1f} seconds ({:.1f}MB)".format(
+            len(matrices), key, time.time() - t, sum(m.nbytes for m in matrices) / 2 ** 20))
+    for jet, m in zip(jets, matrices):
+        if getattr(jet, 'adjacencies', None) is None:
+            jet.adjacencies = {}
+        jet.adjacencies[key] = m
+
+def pad_adjacencies(matrices, n):
+    ''' (batch_size) * n * n tensor of the matrices, zero outside each valid block '''
+    padded = torch.zeros(len(matrices), n, n)
+    for i, m in enumerate(matrices):
+        padded[i, :len(m), :len(m)] = torch.from_numpy(np.asarray(m))
+    return padded
+
+def cache_fixed_adjacency(model, data_loaders, cache_dir=None):
+    '''
+    Have each loader (or the loader under a BatchCache) hand out the cached
+    adjacency of model, or stop doing so if the adjacency of model is not
+    fixed.
+    '''
+    adjacency = fixed_adjacency(model)
+    if adjacency is None:
+        logging.warning("The adjacency of this model is not fixed, not caching it")
+    for data_loader in data_loaders:
+        loader = getattr(data_loader, 'data_loader', data_loader)
+        key = None if adjacency is None else cache_key(adjacency, getattr(loader.dataset, 'tf', None))
+        if key == loader.adjacency_key:
+            continue
+        if key is None:
+            loader.adjacency_key = None
+        elif not loader.cache_adjacency(adjacency, key, cache_dir):
+            continue
+        # batches collated for another adjacency
+        if data_loader is not loader:
+            data_loader.clear()
@@ -1,26 +1,30 @@
+import logging
 import numpy as np
 import torch
-from torch.autograd import Variable
 
 from src.data_ops._DataLoader import _DataLoader
 from src.data_ops.pad_tensors import pad_tensors_extra_channel
-from src.data_ops.dropout import dropout
-from src.data_ops.wrapping import wrap
+from src.data_ops.dropout import augment_padded
+
+from .trees import level_schedule
+from .AdjacencyCache import attach_adjacencies, pad_adjacencies
 
 
 
 class JetLoader(_DataLoader):
-    def __init__(self, dataset, batch_size, leaves=True, dropout=None, permute_particles=False, **kwargs):
-        super().__init__(dataset, batch_size)
+    def __init__(self, dataset, batch_size, leaves=True, dropout=None, permute_particles=False, bucket_size=None, max_n2=None, num_workers=0, pin_memory=False, token_budget=None, budget_mode='n2', shuffle=True, **kwargs):
+        super().__init__(dataset, batch_size, bucket_size, max_n2, num_workers, pin_memory, token_budget, budget_mode, shuffle)
         self.dropout = dropout
         self.permute_particles = permute_particles
         self.leaves = leaves
+        self.adjacency_key = None
+        if not leaves:
+            self.precompute_schedules()
 
     def preprocess_y(self, y_list):
         y = torch.stack([torch.Tensor([int(y)]) for y in y_list], 0)
         if y.size()[1] == 1:
             y = y.squeeze(1)
-        y = wrap(y)
         return y
 
     def preprocess_x(self, x_list):
@@ -29,21 +33,48 @@ class JetLoader(_DataLoader):
         else:
             return self.batch_trees(x_list)
 
-    def batch_leaves(self,x_list):
-        x_list = [x.constituents for x in x_list]
-        if self.permute_particles:
-            data = [torch.from_numpy(np.random.permutation(x)) for x in x_list]
-        else:
-            data = [torch.from_numpy(x) for x in x_list]
-
-        if self.dropout is not None:
-            data = dropout(data, self.dropout)
+    def augment(self, batch):
+        # dropout and permutation act on the padded batch, see augment_padded
+        if not self.leaves or (self.dropout is None and not self.permute_particles):
+            return batch
+        (data, lengths), y = batch
+        data, lengths = augment_padded(data, lengths, self.dropout, self.permute_particles)
+        return (data, lengths), y
 
-        data, mask = pad_tensors_extra_channel(data)
+    def batch_leaves(self,x_list):
+        data = [torch.from_numpy(x.constituents) for x in x_list]
+        data, lengths = pad_tensors_extra_channel(data)
+        if self.adjacency_key is not None:
+            adjacency = pad_adjacencies([x.adjacencies[self.adjacency_key] for x in x_list], data.size(1))
+            return data, lengths, adjacency
+        return data, lengths
+
+    def cache_adjacency(self, adjacency, key, cache_dir=None):
+        '''
+        Hand out the cached matrix of a fixed adjacency with every batch
+        (see AdjacencyCache.py), so that the model does not recompute it.
+        '''
+        # dropout and permutation change the jets of every batch
+        if self.leaves and (self.dropout is not None or self.permute_particles):
+            logging.warning("Not caching the {} adjacency: particle dropout ({}) or permutation ({}) changes the jets of every batch".format(
+                key, self.dropout, self.permute_particles))
+            return False
+        attach_adjacencies(self.dataset.jets, adjacency, key, cache_dir)
+        self.adjacency_key = key
+        return True
+
+    def precompute_schedules(self):
+        for jet in self.dataset.jets:
+            self.jet_schedule(jet)
 
-        data = wrap(data)
-        mask = wrap(mask)
-        return data, mask
+    @staticmethod
+    def jet_schedule(jet):
+        # computed once per jet and kept on the jet, which the dataset holds on to
+        schedule = getattr(jet, 'schedule', None)
+        if schedule is None:
+            schedule = level_schedule(jet.tree, jet.root_id)
+            jet.schedule = schedule
+        return schedule
 
     @staticmethod
     def batch_trees(jets):
@@ -51,77 +82,49 @@ class JetLoader(_DataLoader):
         # !!! Assume that jets have at least one inner node.
         #     Leads to off-by-one errors otherwise :(
 
-        # Reindex node IDs over all jets
-        #
-        # jet_children: array of shape [n_nodes, 2]
-        #     jet_children[node_id, 0] is the node_id of the left child of node_id
-        #     jet_children[node_id, 1] is the node_id of the right child of node_id
+        # Node IDs are reindexed over all jets by offsetting each jet's ids
+        # by the number of nodes in the jets before it
         #
         # jet_contents: array of shape [n_nodes, n_features]
         #     jet_contents[node_id] is the feature vector of node_id
-        jet_children = []
         n_jets = len(jets)
-        offset = 0
-
-        for j, jet in enumerate(jets):
-            tree = np.copy(jet.tree)
-            tree[tree != -1] += offset
-
-            jet_children.append(tree)
-            offset += len(tree)
+        jet_contents = torch.cat([torch.from_numpy(jet.tree_content).float() for jet in jets], 0)
+        n_nodes = sum(len(jet.tree) for jet in jets)
 
-        jet_children = np.vstack(jet_children)
-        jet_contents = torch.cat([Variable(torch.from_numpy(jet.tree_content).float()) for jet in jets], 0)
-        if torch.cuda.is_available():
-            jet_contents = jet_contents.cuda()
-        #import ipdb; ipdb.set_trace()
-        n_nodes = offset
+        # Level-wise traversal, stitched together from each jet's cached schedule
+        schedules = [JetLoader.jet_schedule(jet) for jet in jets]
+        n_depths = max(len(schedule) for schedule in schedules)
 
-        # Level-wise traversal
         level_children = np.zeros((n_nodes, 4), dtype=np.int32)
         level_children[:, [0, 2]] -= 1
 
-        inners = []   # Inner nodes at level i
-        outers = []   # Outer nodes at level i
+        inners = [[] for _ in range(n_depths)]   # Inner nodes at level i
+        outers = [[] for _ in range(n_depths)]   # Outer nodes at level i
+        n_inners_at = [0] * (n_depths + 1)
+        n_outers_at = [0] * (n_depths + 1)
         offset = 0
 
-        for jet in jets:
-            queue = [(jet.root_id + offset, -1, True, 0)]
-
-            while len(queue) > 0:
-                node, parent, is_left, depth = queue.pop(0)
-
-                if len(inners) < depth + 1:
-                    inners.append([])
-                if len(outers) < depth + 1:
-                    outers.append([])
-
-                # Inner node
-                if jet_children[node, 0] != -1:
-                    inners[depth].append(node)
-                    position = len(inners[depth]) - 1
-                    is_leaf = False
-
-                    queue.append((jet_children[node, 0], node, True, depth + 1))
-                    queue.append((jet_children[node, 1], node, False, depth + 1))
-
-                # Outer node
-                else:
-                    outers[depth].append(node)
-                    position = len(outers[depth]) - 1
-                    is_leaf = True
-
-                # Register node at its parent
-                if parent >= 0:
-                    if is_left:
-                        level_children[parent, 0] = position
-                        level_children[parent, 1] = is_leaf
-                    else:
-                        level_children[parent, 2] = position
-                        level_children[parent, 3] = is_leaf
+        for jet, schedule in zip(jets, schedules):
+            for depth, (inner, outer, children) in enumerate(schedule):
+                inner = inner + offset
+                inners[depth].append(inner)
+                outers[depth].append(outer + offset)
+
+                # shift child positions past the same-depth nodes of previous jets
+                if len(inner) > 0:
+                    children = children.copy()
+                    for pos, leaf in [(0, 1), (2, 3)]:
+                        children[:, pos] += np.where(children[:, leaf] == 1, n_outers_at[depth + 1], n_inners_at[depth + 1])
+                    level_children[inner] = children
+
+                n_inners_at[depth] += len(inner)
+                n_outers_at[depth] += len(outer)
 
             offset += len(jet.tree)
 
+        inners = [np.concatenate(inner) for inner in inners]
+        outers = [np.concatenate(outer) for outer in outers]
+
         # Reorganize levels[i] so that inner nodes appear first, then outer nodes
         levels = []
         n_inners = []
@@ -135,7 +138,6 @@ class JetLoader(_DataLoader):
             outer = np.array(outer, dtype=int)
             level = np.concatenate((inner, outer))
             level = torch.from_numpy(level)
-            if torch.cuda.is_available(): level = level.cuda()
             levels.append(level)
 
             left = prev_inner[level_children[prev_inner, 1] == 1]
@@ -168,8 +170,5 @@ class JetLoader(_DataLoader):
 
         level_children = torch.from_numpy(level_children).long()
         n_inners = torch.from_numpy(np.array(n_inners)).long()
-        if torch.cuda.is_available():
-            level_children = level_children.cuda()
-            n_inners = n_inners.cuda()
 
         return (levels, level_children[:, [0, 2]], n_inners, contents, n_jets)
@@ -0,0 +1,200 @@
+import os
+import numpy as np
+
+from .Jet import Jet, QuarkGluonJet
+
+'''
+On-disk columnar format for preprocessed jets.
+
+A store is a directory of .npy files, one per column:
+    constituents, constituents_offsets <- ragged (total_particles) * 7 array
+        and its (n_jets + 1) offsets
+    tree, tree_content, tree_offsets <- ragged (total_nodes) * 2 and
+        (total_nodes) * F arrays sharing one set of offsets (optional)
+    mass, pt, eta, phi, y, progenitor, ... <- one scalar per jet
+
+Columns are opened with np.load(..., mmap_mode='r'), so opening a store is
+O(1) and only the jets that are actually touched get paged in.
+'''
+
+STORE_EXTENSION = '.jets'
+
+RAGGED_FIELDS = dict(
+    constituents='constituents_offsets',
+    tree='tree_offsets',
+    tree_content='tree_offsets',
+)
+
+SCALAR_FIELDS = dict(
+    progenitor=str,
+    mass=np.float64,
+    pt=np.float64,
+    eta=np.float64,
+    phi=np.float64,
+    y=np.int64,
+    root_id=np.int64,
+    photon_pt=np.float64,
+    photon_eta=np.float64,
+    photon_phi=np.float64,
+    env=np.int64,
+)
+
+def store_path(filename):
+    return os.path.splitext(filename)[0] + STORE_EXTENSION
+
+def store_exists(filename):
+    return os.path.isdir(store_path(filename))
+
+def _jet_dicts(part):
+    if isinstance(part, JetStore):
+        for i in range(len(part)):
+            yield part.jet_dict(i)
+    else:
+        for jd in part:
+            yield jd if isinstance(jd, dict) else vars(jd)
+
+def write_jet_store(path, parts):
+    '''
+    Write jets to a columnar store at path.
+    parts is a list of sequences of jet dicts (or JetStores). Each sequence is
+    iterated twice: once to size the columns, once to fill them, so the jets
+    never need to be held in memory all at once.
+    '''
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    n_jets = 0
+    n_rows = {offset_name: 0 for offset_name in set(RAGGED_FIELDS.values())}
+    shapes = {}
+    scalar_fields = None
+    for part in parts:
+        for jd in _jet_dicts(part):
+            n_jets += 1
+            fields = set(name for name in SCALAR_FIELDS if jd.get(name, None) is not None)
+            scalar_fields = fields if scalar_fields is None else scalar_fields & fields
+            counted = set()
+            for name, offset_name in RAGGED_FIELDS.items():
+                x = jd.get(name, None)
+                if x is None:
+                    continue
+                shapes.setdefault(name, (np.asarray(x).shape[1:], np.asarray(x).dtype))
+                if offset_name not in counted:
+                    n_rows[offset_name] += len(x)
+                    counted.add(offset_name)
+
+    columns = {}
+    for name, (shape, dtype) in shapes.items():
+        columns[name] = np.lib.format.open_memmap(
+            os.path.join(path, name + '.npy'), mode='w+', dtype=dtype, shape=(n_rows[RAGGED_FIELDS[name]],) + shape
+        )
+    offsets = {offset_name: np.zeros(n_jets + 1, dtype=np.int64) for offset_name in set(RAGGED_FIELDS[name] for name in shapes)}
+    scalars = {name: [] for name in (scalar_fields or [])}
+
+    i = 0
+    for part in parts:
+        for jd in _jet_dicts(part):
+            filled = set()
+            for name in shapes:
+                offset_name = RAGGED_FIELDS[name]
+                x = jd[name]
+                start = offsets[offset_name][i]
+                columns[name][start:start + len(x)] = x
+                if offset_name not in filled:
+                    offsets[offset_name][i + 1] = start + len(x)
+                    filled.add(offset_name)
+            for name in scalars:
+                scalars[name].append(jd[name])
+            i += 1
+
+    for name, column in columns.items():
+        column.flush()
+    for offset_name, offset in offsets.items():
+        np.save(os.path.join(path, offset_name + '.npy'), offset)
+    for name, values in scalars.items():
+        np.save(os.path.join(path, name + '.npy'), np.array(values, dtype=SCALAR_FIELDS[name]))
+
+    return path
+
+
+class JetStore:
+    '''
+    Sequence of jets backed by a columnar store. Indexing with an int returns
+    a Jet whose arrays are memory-mapped views; indexing with a slice or an
+    index array returns another JetStore over the same columns.
+
+    Jets are built lazily and cached, so in-place changes (e.g. normalizing
+    jet.constituents) stick for the lifetime of the store.
+    '''
+    def __init__(self, path, indices=None, columns=None, cache=None):
+        self.path = path
+        if columns is None:
+            columns = {}
+            for fn in os.listdir(path):
+                name, ext = os.path.splitext(fn)
+                if ext == '.npy':
+                    columns[name] = np.load(os.path.join(path, fn), mmap_mode='r')
+        self.columns = columns
+        self.n_total = len(columns['y'])
+        self.indices = np.arange(self.n_total) if indices is None else np.asarray(indices, dtype=np.int64)
+        self.cache = {} if cache is None else cache
+        self.JetClass = QuarkGluonJet if 'photon_pt' in columns else Jet
+
+    def __getstate__(self):
+        # memmaps would be pickled by value; reopen them on the other side instead
+        state = dict(vars(self))
+        state['columns'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['indices'], None, state['cache'])
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (slice, list, np.ndarray)):
+            return JetStore(self.path, self.indices[idx], self.columns, self.cache)
+        j = int(self.indices[idx])
+        jet = self.cache.get(j, None)
+        if jet is None:
+            jet = self.JetClass(**self.jet_dict(idx))
+            self.cache[j] = jet
+        return jet
+
+    def __setitem__(self, idx, jet):
+        self.cache[int(self.indices[idx])] = jet
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def column(self, name):
+        ''' Scalar column for the jets in this store, e.g. store.column('pt') '''
+        return np.asarray(self.columns[name][self.indices])
+
+    def lengths(self, name='constituents'):
+        ''' Number of rows of a ragged column for each jet, without building any Jet '''
+        offsets = self.columns[RAGGED_FIELDS[name]]
+        return np.asarray(offsets[self.indices + 1] - offsets[self.indices])
+
+    def jet_dict(self, idx):
+        j = int(self.indices[idx])
+        jd = {}
+        for name, offset_name in RAGGED_FIELDS.items():
+            if name in self.columns:
+                offsets = self.columns[offset_name]
+                jd[name] = self.columns[name][offsets[j]:offsets[j+1]]
+        for name, dtype in SCALAR_FIELDS.items():
+            if name in self.columns:
+                value = self.columns[name][j]
+                jd[name] = str(value) if dtype is str else value.item()
+        return jd
+
+    def jet_dicts(self):
+        return [self.jet_dict(i) for i in range(len(self))]
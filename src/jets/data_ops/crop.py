@@ -0,0 +1,80 @@
+import logging
+import math
+import numpy as np
+
+from .JetStore import JetStore
+
+'''
+Kinematic cuts shared by JetDataset.crop and the per-problem crop_dataset
+modules. Cuts are evaluated on whole columns at once and return index arrays
+into the jets, so a JetStore is cropped without building a single Jet.
+'''
+
+W_VS_QCD_CUTS = {
+    'antikt-kt': dict(pt_min=250, pt_max=300, m_min=50, m_max=110),
+    'antikt-kt-pileup': dict(pt_min=300, pt_max=365, m_min=150, m_max=220),
+}
+
+QUARK_GLUON_CUTS = dict(
+    pt_min=50,
+    eta_max=1.5,
+    photon_pt_min=100,
+    delta_phi_min=2 * math.pi / 3,
+)
+
+def jet_column(jets, name):
+    if isinstance(jets, JetStore):
+        return jets.column(name)
+    return np.array([getattr(j, name) for j in jets])
+
+def select(jets, indices):
+    if isinstance(jets, JetStore):
+        return jets[indices]
+    return [jets[i] for i in indices]
+
+def flatness_weights(pt, y, pt_min, pt_max, bins=50):
+    '''
+    Per-jet weights that flatten the pt distribution of each class over
+    [pt_min, pt_max]. Within a class the weights sum to one.
+    '''
+    w = np.zeros(len(pt))
+    for label in np.unique(y):
+        in_class = y == label
+        pdf, edges = np.histogram(pt[in_class], density=True, range=[pt_min, pt_max], bins=bins)
+        indices = np.searchsorted(edges, pt[in_class]) - 1
+        inv_w = 1. / pdf[indices]
+        w[in_class] = inv_w / inv_w.sum()
+    return w
+
+def crop_w_vs_qcd(jets, pt_min, pt_max, m_min, m_max, bins=50):
+    ''' Returns (good indices, bad indices, pt-flattening weights of the good jets) '''
+    pt = jet_column(jets, 'pt')
+    mass = jet_column(jets, 'mass')
+    good = (pt_min < pt) & (pt < pt_max) & (m_min < mass) & (mass < m_max)
+    good_indices = np.where(good)[0]
+    bad_indices = np.where(~good)[0]
+
+    w = flatness_weights(pt[good], jet_column(jets, 'y')[good], pt_min, pt_max, bins)
+    return good_indices, bad_indices, w
+
+def crop_quark_gluon(jets, pt_min, eta_max, photon_pt_min, delta_phi_min):
+    ''' Returns (good indices, bad indices, None) '''
+    delta_phi = np.abs(jet_column(jets, 'phi') - jet_column(jets, 'photon_phi'))
+    delta_phi = np.where(delta_phi > math.pi, delta_phi - math.pi, delta_phi)
+
+    filters = [
+        ('pt', jet_column(jets, 'pt') <= pt_min),
+        ('eta', np.abs(jet_column(jets, 'eta')) >= eta_max),
+        ('photon_pt', jet_column(jets, 'photon_pt') <= photon_pt_min),
+        ('photon_eta', np.abs(jet_column(jets, 'photon_eta')) >= eta_max),
+        ('delta_phi', delta_phi <= delta_phi_min),
+    ]
+    bad = np.zeros(len(jets), dtype=bool)
+    for _, mask in filters:
+        bad |= mask
+
+    logging.warning('applied cuts to {} jets'.format(len(jets)))
+    for name, mask in filters:
+        logging.warning('bad {} = {}'.format(name, mask.sum()))
+
+    return np.where(~bad)[0], np.where(bad)[0], None
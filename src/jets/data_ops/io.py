@@ -1,5 +1,6 @@
 import pickle
 from .Jet import Jet, QuarkGluonJet
+from .JetStore import JetStore, write_jet_store, store_path
 
 def save_jets_to_pickle(jets, filename):
     jet_dicts = [vars(jet) for jet in jets]
@@ -14,7 +15,7 @@ def load_jet_dicts_from_pickle(filename):
         jet_dicts = pickle.load(f, encoding='latin-1')
 
     return jet_dicts
-    
+
 def load_jets_from_pickle(filename):
     jet_dicts = load_jet_dicts_from_pickle(filename)
     if 'quark-gluon' in filename:
@@ -23,3 +24,14 @@ def load_jets_from_pickle(filename):
         JetClass = Jet
     jets = [JetClass(**jd) for jd in jet_dicts]
     return jets
+
+def save_jet_dicts_to_store(jet_dicts, filename):
+    return write_jet_store(store_path(filename), [jet_dicts])
+
+def load_jets_from_store(filename):
+    return JetStore(store_path(filename))
+
+def convert_pickle_to_store(filename):
+    ''' One-shot conversion of a preprocessed list-of-dicts pickle to a columnar store '''
+    jet_dicts = load_jet_dicts_from_pickle(filename)
+    return save_jet_dicts_to_store(jet_dicts, filename)
@@ -3,10 +3,23 @@ import os
 import pickle
 import numpy as np
 
-from .io import load_jets_from_pickle, save_jets_to_pickle
+from .io import load_jets_from_pickle, save_jets_to_pickle, load_jets_from_store
+from .JetStore import store_exists
 from .JetDataset import JetDataset
+from .scaler import Scaler
 
-def load_jets(data_dir, filename, redo=False, preprocess_fn=None):
+# the validation split that load_scaler rebuilds the shared scaler with
+CANONICAL_N_VALID = 27000
+
+def scaler_path(data_dir, subproblem, n_valid=CANONICAL_N_VALID):
+    '''
+    Normalizing transform of the full training set, next to the preprocessed
+    data. The training set depends on the validation split, so n_valid is
+    part of the name.
+    '''
+    return os.path.join(data_dir, 'preprocessed', '{}-valid{}-scaler.npz'.format(subproblem, n_valid))
+
+def load_jets(data_dir, filename, redo=False, preprocess_fn=None, n_workers=None):
 
     #preprocessed_dir = os.path.join(data_dir, 'preprocessed')
 
@@ -14,23 +27,28 @@ def load_jets(data_dir, filename, redo=False, preprocess_fn=None):
     preprocessed_dir = os.path.join(data_dir, 'preprocessed')
     path_to_preprocessed = os.path.join(preprocessed_dir, filename)
 
-    if not os.path.exists(path_to_preprocessed) or redo:
+    preprocessed = store_exists(path_to_preprocessed) or os.path.exists(path_to_preprocessed)
+    if not preprocessed or redo:
         if not os.path.exists(preprocessed_dir):
             os.makedirs(preprocessed_dir)
 
         logging.warning("Preprocessing...")
 
-        preprocess_fn(raw_data_dir, preprocessed_dir, filename)
+        preprocess_fn(raw_data_dir, preprocessed_dir, filename, n_workers=n_workers)
 
         logging.warning("Preprocessed the data and saved it to {}".format(path_to_preprocessed))
     else:
         logging.warning("Data at {} and already preprocessed".format(path_to_preprocessed))
 
-    jets = load_jets_from_pickle(path_to_preprocessed)
+    if store_exists(path_to_preprocessed):
+        jets = load_jets_from_store(path_to_preprocessed)
+    else:
+        logging.warning("No columnar store for {}, falling back to pickle (see src/scripts/convert_jets.py)".format(path_to_preprocessed))
+        jets = load_jets_from_pickle(path_to_preprocessed)
     logging.warning("\tSuccessfully loaded data")
     return jets
 
-def load_train_dataset(data_dir, filename, n_train, n_valid, redo):
+def load_train_dataset(data_dir, filename, n_train, n_valid, redo, n_workers=None):
     if 'w-vs-qcd' in data_dir:
         from .w_vs_qcd import preprocess, crop_dataset
     elif 'quark-gluon' in data_dir:
@@ -45,7 +63,7 @@ def load_train_dataset(data_dir, filename, n_train, n_valid, redo):
     logging.warning("Loading data...")
     filename = "{}-train.pickle".format(filename)
 
-    jets = load_jets(data_dir, filename, redo, preprocess_fn=preprocess)
+    jets = load_jets(data_dir, filename, redo, preprocess_fn=preprocess, n_workers=n_workers)
     logging.warning("Found {} jets in total".format(len(jets)))
 
     if n_train > 0:
@@ -70,13 +88,35 @@ def load_train_dataset(data_dir, filename, n_train, n_valid, redo):
 
     valid_dataset.transform(train_dataset.tf)
 
+    # only the full training set defines the transform used at test time
+    if n_train <= 0:
+        train_dataset.tf.save(scaler_path(data_dir, subproblem, n_valid))
+
     # add cropped indices to training data
     logging.warning("\tfinal train size = %d" % len(train_dataset))
     logging.warning("\tfinal valid size = %d" % len(valid_dataset))
 
     return train_dataset, valid_dataset
 
-def load_test_dataset(data_dir, filename, n_test, redo):
+def load_scaler(data_dir, filename, scaler_filename=None, n_workers=None):
+    '''
+    The scaler at scaler_filename, else the one of the full training set with
+    the canonical validation split (rebuilt if missing)
+    '''
+    if scaler_filename is None or not os.path.exists(scaler_filename):
+        scaler_filename = scaler_path(data_dir, filename)
+    if not os.path.exists(scaler_filename):
+        logging.warning("No saved scaler at {}, rebuilding it from the training set".format(scaler_filename))
+        load_train_dataset(data_dir, filename, -1, CANONICAL_N_VALID, False, n_workers)
+    tf = Scaler.load(scaler_filename)
+    logging.warning("Loaded normalizing transform from {}".format(scaler_filename))
+    return tf
+
+def load_test_dataset(data_dir, filename, n_test, redo, n_workers=None, scaler_filename=None, transform=True):
+    '''
+    With transform False the constituents are left unnormalized, for the
+    caller to normalize with each model's own scaler.
+    '''
     if 'w-vs-qcd' in data_dir:
         from .w_vs_qcd import preprocess, crop_dataset
     elif 'quark-gluon' in data_dir:
@@ -84,14 +124,17 @@ def load_test_dataset(data_dir, filename, n_test, redo):
     else:
         raise ValueError('Unrecognized data_dir!')
 
-    train_dataset, _ = load_train_dataset(data_dir, filename, -1, 27000, False)
+    if transform:
+        tf = load_scaler(data_dir, filename, scaler_filename, n_workers)
+
     logging.warning("Loading test data...")
     filename = "{}-test.pickle".format(filename)
-    jets = load_jets(data_dir, filename, redo)
+    jets = load_jets(data_dir, filename, redo, preprocess_fn=preprocess, n_workers=n_workers)
     jets = jets[:n_test]
 
     dataset = JetDataset(jets)
-    dataset.transform(train_dataset.tf)
+    if transform:
+        dataset.transform(tf)
 
     # crop validation set and add the excluded data to the training set
     dataset, _ = crop_dataset(dataset, pileup=False)
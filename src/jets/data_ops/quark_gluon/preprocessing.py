@@ -1,42 +1,51 @@
-
-import torch
 import os
-import pickle
+import mmap
+import time
+import shutil
+import logging
 
 import numpy as np
-from ..extract_four_vectors import extract_four_vectors
-from ..io import save_jet_dicts_to_pickle
-
-
-def process_textfile(contents):
-    jet_contents = []
-
-    line_index = 0
-    contents = [''] + contents
-    while line_index < len(contents):
-        line = contents[line_index]
-        if len(line) == 0:
-            counter = 0
-            line_index += 1
-            header = contents[line_index]
-            if len(header) == 0:
-                break
+from src.data_ops.parallel import parallel_map, chunks, default_n_workers
+from ..extract_four_vectors import extract_four_vectors, extract_four_vectors_columnar
+from ..JetStore import JetStore, write_jet_store, store_path
+
+
+def iter_jet_records(filename):
+    '''
+    Stream (constituents, header) text records out of a quark-gluon text file.
+    Records are separated by blank lines; the first line of a record is the
+    jet header and the remaining lines are its constituents. The file is
+    memory-mapped, so only the current record is ever held in memory.
+    '''
+    with open(filename, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = None
             constituents = []
-            line_index += 1
-            line = contents[line_index]
-            while len(line) > 0:
-                constituents.append(line)
-                counter += 1
-                line_index += 1
-                line = contents[line_index]
-            jet_contents.append((constituents, header))
-    return jet_contents
-
-
-def convert_to_jet_dict(entry, progenitor, y, env):
+            for line in iter(mm.readline, b''):
+                line = line.strip()
+                if len(line) == 0:
+                    if header is not None:
+                        yield b'\n'.join(constituents).decode(), header.decode()
+                    header = None
+                    constituents = []
+                elif header is None:
+                    header = line
+                else:
+                    constituents.append(line)
+            if header is not None:
+                yield b'\n'.join(constituents).decode(), header.decode()
+        finally:
+            mm.close()
+
+def parse_record(entry):
     constituents, header = entry
+    header = np.fromstring(header, dtype=np.float64, sep=' ')
+    four_vectors = np.fromstring(constituents, dtype=np.float64, sep=' ').reshape(-1, 4)
+    return four_vectors, header
 
-    header = [float(x) for x in header.split('\t')]
+def convert_to_jet_dict(entry, progenitor, y, env, constituents=None):
+    four_vectors, header = parse_record(entry)
 
     (mass,
     photon_pt,
@@ -46,10 +55,10 @@ def convert_to_jet_dict(entry, progenitor, y, env):
     jet_eta,
     jet_phi,
     n_constituents
-    ) = header
+    ) = header.tolist()
 
-    constituents = [[float(x) for x in particle.split('\t')] for particle in constituents]
-    constituents = extract_four_vectors(np.array(constituents))
+    if constituents is None:
+        constituents = extract_four_vectors(four_vectors)
 
     assert len(constituents) == n_constituents
 
@@ -68,10 +77,21 @@ def convert_to_jet_dict(entry, progenitor, y, env):
     )
     return jet_dict
 
-
-
-
-def make_jet_dicts_from_textfile(filename):
+def convert_batch(args):
+    # parse a batch of records and extract all their constituents in one pass
+    chunk_path, entries, progenitor, y, env = args
+    t = time.time()
+    four_vectors = [parse_record(entry)[0] for entry in entries]
+    offsets = np.concatenate([[0], np.cumsum([len(fv) for fv in four_vectors])])
+    constituents = extract_four_vectors_columnar(np.concatenate(four_vectors, 0), offsets)
+    jet_dicts = [
+        convert_to_jet_dict(entry, progenitor, y, env, constituents[start:end])
+        for entry, start, end in zip(entries, offsets[:-1], offsets[1:])
+    ]
+    write_jet_store(chunk_path, [jet_dicts])
+    return chunk_path, len(jet_dicts), time.time() - t
+
+def labels_from_filename(filename):
     tail = filename.split('/')[-1]
     if 'quark' in tail:
         progenitor = 'quark'
@@ -87,51 +107,62 @@ def make_jet_dicts_from_textfile(filename):
         env = 1
     else:
         raise ValueError('unrecognised env')
+    return progenitor, y, env
+
+def make_jet_stores_from_textfile(filename, chunks_dir, n_workers=None, batch_size=1000):
+    ''' Convert a text file batch by batch in a process pool, one chunk store per batch '''
+    progenitor, y, env = labels_from_filename(filename)
+    prefix = os.path.join(chunks_dir, os.path.basename(filename))
+    tasks = (
+        ('{}.{:06d}'.format(prefix, i), entries, progenitor, y, env)
+        for i, entries in enumerate(chunks(iter_jet_records(filename), batch_size))
+        )
+
+    t = time.time()
+    chunk_paths = []
+    n_jets = 0
+    for chunk_path, n, _ in parallel_map(convert_batch, tasks, n_workers):
+        chunk_paths.append(chunk_path)
+        n_jets += n
+    elapsed = time.time() - t
+    logging.warning("Converted {} jets from {} in {:.1f} seconds ({:.0f} jets per second)".format(n_jets, filename, elapsed, n_jets / max(elapsed, 1e-6)))
+    return chunk_paths
 
-    with open(filename, 'r') as f:
-        contents = [l.strip() for l in f.read().split('\n')]
-
-    entries = process_textfile(contents)
-
-    jet_dicts = []
-    for entry in entries:
-        jet_dict = convert_to_jet_dict(entry, progenitor, y, env)
-        jet_dicts.append(jet_dict)
-
-
-    return jet_dicts
+def make_jet_dicts_from_textfile(filename):
+    progenitor, y, env = labels_from_filename(filename)
+    return [convert_to_jet_dict(entry, progenitor, y, env) for entry in iter_jet_records(filename)]
 
-def preprocess(raw_data_dir, preprocessed_dir, filename):
-    #raw_data_dir = os.path.join(data_dir, 'raw')
-    #preprocessed_dir = os.path.join(data_dir, 'preprocessed')
+def preprocess(raw_data_dir, preprocessed_dir, filename, n_workers=None):
+    n_workers = default_n_workers(n_workers)
 
     env_type = filename.split('-')[0]
     quark_filename = os.path.join(raw_data_dir, 'quark_' + env_type + '.txt')
     gluon_filename = os.path.join(raw_data_dir, 'gluon_' + env_type + '.txt')
 
-    quark_jet_dicts = make_jet_dicts_from_textfile(quark_filename)
-    gluon_jet_dicts = make_jet_dicts_from_textfile(gluon_filename)
-    jet_dicts = quark_jet_dicts + gluon_jet_dicts
+    chunks_dir = os.path.join(preprocessed_dir, env_type + '.chunks')
+    if os.path.exists(chunks_dir):
+        shutil.rmtree(chunks_dir)
+    os.makedirs(chunks_dir)
 
-    perm = np.random.permutation(len(jet_dicts))
-    jet_dicts = [jet_dicts[i] for i in perm]
+    chunk_paths = make_jet_stores_from_textfile(quark_filename, chunks_dir, n_workers)
+    chunk_paths += make_jet_stores_from_textfile(gluon_filename, chunks_dir, n_workers)
 
-    # split into train and test
-    test_fraction = 0.1
-    n_test = int(len(jet_dicts) * test_fraction)
-    test_jet_dicts = jet_dicts[:n_test]
-    train_jet_dicts = jet_dicts[n_test:]
+    t = time.time()
+    all_path = os.path.join(chunks_dir, 'all')
+    write_jet_store(all_path, [JetStore(path) for path in chunk_paths])
+    jets = JetStore(all_path)
 
+    perm = np.random.permutation(len(jets))
 
-    new_test_jet_dicts, new_train_jet_dicts = [], []
-    for i, jet_dict in enumerate(jet_dicts):
-        if i < n_test:
-            new_test_jet_dicts.append(jet_dict)
-        else:
-            new_train_jet_dicts.append(jet_dict)
+    # split into train and test
+    test_fraction = 0.1
+    n_test = int(len(jets) * test_fraction)
 
-    save_jet_dicts_to_pickle(new_train_jet_dicts, os.path.join(preprocessed_dir, env_type + '-train.pickle'))
-    save_jet_dicts_to_pickle(new_test_jet_dicts, os.path.join(preprocessed_dir, env_type + '-test.pickle'))
+    write_jet_store(store_path(os.path.join(preprocessed_dir, env_type + '-train.pickle')), [jets[perm[n_test:]]])
+    write_jet_store(store_path(os.path.join(preprocessed_dir, env_type + '-test.pickle')), [jets[perm[:n_test]]])
 
+    del jets
+    shutil.rmtree(chunks_dir)
+    logging.warning("Shuffled and split {} jets in {:.1f} seconds".format(len(perm), time.time() - t))
 
     return None
@@ -0,0 +1,59 @@
+import hashlib
+import numpy as np
+
+class Scaler:
+    '''
+    Per-feature standardization x -> (x - mean) / std.
+    The statistics are accumulated one array at a time (Welford / Chan et al.
+    pairwise update), so fitting never materializes the concatenation of all
+    constituents. Saved as a small .npz file, with its version so that a
+    file that does not hold what was saved is refused on load.
+    '''
+    def __init__(self, mean=None, std=None):
+        self.mean = mean
+        self.std = std
+
+    def __call__(self, x):
+        return (x - self.mean) / self.std
+
+    @property
+    def version(self):
+        ''' Short hash of the statistics, to tell scalers apart '''
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(self.mean, dtype=np.float64).tobytes())
+        h.update(np.ascontiguousarray(self.std, dtype=np.float64).tobytes())
+        return h.hexdigest()[:8]
+
+    @classmethod
+    def fit(cls, arrays):
+        n = 0
+        mean = None
+        m2 = None
+        for x in arrays:
+            n_b = len(x)
+            if n_b == 0:
+                continue
+            mean_b = x.mean(0)
+            m2_b = ((x - mean_b) ** 2).sum(0)
+            if mean is None:
+                n, mean, m2 = n_b, mean_b, m2_b
+                continue
+            delta = mean_b - mean
+            n_ab = n + n_b
+            mean = mean + delta * (n_b / n_ab)
+            m2 = m2 + m2_b + delta ** 2 * (n * n_b / n_ab)
+            n = n_ab
+        return cls(mean, np.sqrt(m2 / n))
+
+    def save(self, filename):
+        np.savez(filename, mean=self.mean, std=self.std, version=np.array(self.version))
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            tf = cls(f['mean'], f['std'])
+            # files saved before versions were stored have none to check
+            version = str(f['version']) if 'version' in f.files else tf.version
+        if version != tf.version:
+            raise ValueError("Scaler {} has version {} but its statistics hash to {}".format(filename, version, tf.version))
+        return tf
@@ -0,0 +1,85 @@
+import numpy as np
+
+'''
+Array-based utilities for binary jet trees.
+
+A tree is an (n_nodes) * 2 integer array: tree[i] holds the ids of the left
+and right children of node i, or (-1, -1) if i is a leaf. Everything here is
+iterative and vectorized one level at a time, so deep trees cannot hit the
+recursion limit.
+'''
+
+def level_order(tree, root_id):
+    '''
+    Breadth-first traversal of a tree, one array of node ids per depth.
+    Within a depth, nodes appear in the order a FIFO queue would visit them,
+    so the children of the inner nodes of levels[d] appear in levels[d+1] as
+    consecutive (left, right) pairs.
+    '''
+    levels = []
+    nodes = np.array([root_id], dtype=np.int64)
+    while len(nodes) > 0:
+        levels.append(nodes)
+        children = tree[nodes]
+        nodes = children[children[:, 0] != -1].reshape(-1).astype(np.int64)
+    return levels
+
+def inner_nodes(tree, levels):
+    nodes = np.concatenate(levels)
+    return nodes[tree[nodes, 0] != -1]
+
+def leaves(tree):
+    return np.where(tree[:, 0] == -1)[0]
+
+def node_pt(content):
+    ''' Transverse momentum of every row of an (n_nodes) * (px, py, pz, ...) array '''
+    pz = content[:, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = (content[:, 0:3] ** 2).sum(1) ** 0.5
+        eta = 0.5 * (np.log(p + pz) - np.log(p - pz))
+        pt = p / np.cosh(eta)
+    return pt
+
+def sum_content(tree, content, levels):
+    ''' In place: set the content of every inner node to the sum of its children's '''
+    for nodes in levels[::-1]:
+        inner = nodes[tree[nodes, 0] != -1]
+        if len(inner) > 0:
+            content[inner] = content[tree[inner, 0]] + content[tree[inner, 1]]
+    return content
+
+def order_children_by_pt(tree, content, levels):
+    ''' In place: swap children so the left sub-jet always has the larger pt '''
+    inner = inner_nodes(tree, levels)
+    pt = node_pt(content)
+    swap = inner[pt[tree[inner, 0]] < pt[tree[inner, 1]]]
+    tree[swap] = tree[swap][:, ::-1]
+    return tree
+
+def level_schedule(tree, root_id):
+    '''
+    Per-depth batching schedule of one tree: a list of (inner, outer, children)
+    where inner and outer are the ids of the inner nodes and leaves at that
+    depth, and children[k] = (left position, left is leaf, right position,
+    right is leaf) for inner[k]. Positions index into the inner or outer
+    nodes of the next depth, whichever the child belongs to.
+    '''
+    levels = level_order(tree, root_id)
+    schedule = []
+    for depth, nodes in enumerate(levels):
+        is_leaf = tree[nodes, 0] == -1
+        inner = nodes[~is_leaf]
+        outer = nodes[is_leaf]
+        children = np.zeros((len(inner), 4), dtype=np.int32)
+        if depth + 1 < len(levels):
+            child_is_leaf = tree[levels[depth + 1], 0] == -1
+            position = np.zeros(len(child_is_leaf), dtype=np.int32)
+            position[~child_is_leaf] = np.arange((~child_is_leaf).sum())
+            position[child_is_leaf] = np.arange(child_is_leaf.sum())
+            # children come in (left, right) pairs, in the order of inner
+            children[:, 0] = position[0::2]
+            children[:, 1] = child_is_leaf[0::2]
+            children[:, 2] = position[1::2]
+            children[:, 3] = child_is_leaf[1::2]
+        schedule.append((inner, outer, children))
+    return schedule
@@ -1,60 +1,31 @@
 import os
+import time
+import shutil
 import logging
 import pickle
 import numpy as np
 
+from src.data_ops.parallel import parallel_map, default_n_workers
 from ..extract_four_vectors import extract_four_vectors
-from ..io import save_jet_dicts_to_pickle
+from ..JetStore import JetStore, write_jet_store, store_path
+from ..trees import level_order, leaves, sum_content, order_children_by_pt
 
 
-def _pt(v):
-    pz = v[2]
-    p = (v[0:3] ** 2).sum() ** 0.5
-    eta = 0.5 * (np.log(p + pz) - np.log(p - pz))
-    pt = p / np.cosh(eta)
-    return pt
-
-def permute_by_pt(jet, root_id=None):
+def permute_by_pt(jet, levels=None):
     # ensure that the left sub-jet has always a larger pt than the right
-
-    if root_id is None:
-        root_id = jet["root_id"]
-
-    if jet["tree"][root_id][0] != -1:
-        left = jet["tree"][root_id][0]
-        right = jet["tree"][root_id][1]
-
-        pt_left = _pt(jet["content"][left])
-        pt_right = _pt(jet["content"][right])
-
-        if pt_left < pt_right:
-            jet["tree"][root_id][0] = right
-            jet["tree"][root_id][1] = left
-
-        permute_by_pt(jet, left)
-        permute_by_pt(jet, right)
-
+    if levels is None:
+        levels = level_order(jet["tree"], jet["root_id"])
+    order_children_by_pt(jet["tree"], jet["content"], levels)
     return jet
 
-def rewrite_content(jet):
-    #jet = copy.deepcopy(jet)
+def rewrite_content(jet, levels=None):
+    if levels is None:
+        levels = level_order(jet["tree"], jet["root_id"])
 
     if jet["content"].shape[1] == 5:
         pflow = jet["content"][:, 4].copy()
 
-    content = jet["content"]
-    tree = jet["tree"]
-
-    def _rec(i):
-        if tree[i, 0] == -1:
-            pass
-        else:
-            _rec(tree[i, 0])
-            _rec(tree[i, 1])
-            c = content[tree[i, 0]] + content[tree[i, 1]]
-            content[i] = c
-
-    _rec(jet["root_id"])
+    sum_content(jet["tree"], jet["content"], levels)
 
     if jet["content"].shape[1] == 5:
         jet["content"][:, 4] = pflow
@@ -62,7 +33,10 @@ def rewrite_content(jet):
     return jet
 
 def convert_to_jet_dict(x, y):
-    x = permute_by_pt(rewrite_content(x))
+    # child swaps do not change which nodes sit at which depth,
+    # so one traversal serves both passes
+    levels = level_order(x['tree'], x['root_id'])
+    x = permute_by_pt(rewrite_content(x, levels), levels)
 
     tree_content = x['content']
     tree = x['tree']
@@ -72,12 +46,8 @@ def convert_to_jet_dict(x, y):
     pt = x['pt']
     mass = x['mass']
 
-    outers = [node for node in range(len(x['content'])) if x['tree'][node,0] == -1]
-    constituents = extract_four_vectors(np.stack([tree_content[i] for i in outers], 0))
-    #constituents = const
-    #tree_content = extract_four_vectors(tree_content)
-    #constituents = np.stack([tree_content[i] for i in outers], 0)
-    #import ipdb; ipdb.set_trace()
+    outers = leaves(tree)
+    constituents = extract_four_vectors(tree_content[outers])
     progenitor = 'w' if y == 1 else 'qcd'
 
     jet_dict = dict(
@@ -95,15 +65,45 @@ def convert_to_jet_dict(x, y):
 
     return jet_dict
 
-def preprocess(raw_data_dir, preprocessed_dir, filename):
+def convert_chunk(args):
+    chunk_path, X, Y = args
+    t = time.time()
+    jet_dicts = [convert_to_jet_dict(x, y) for x, y in zip(X, Y)]
+    write_jet_store(chunk_path, [jet_dicts])
+    return chunk_path, len(jet_dicts), time.time() - t
+
+def preprocess(raw_data_dir, preprocessed_dir, filename, n_workers=None, chunk_size=2000):
+    n_workers = default_n_workers(n_workers)
 
+    t = time.time()
     raw_filename = os.path.join(raw_data_dir, filename)
     with open(raw_filename, 'rb') as f:
         X, Y = pickle.load(f, encoding='latin-1')
-    logging.warning("Loaded raw files")
-    jet_dicts = [convert_to_jet_dict(x, y) for x, y in zip(X, Y)]
-    logging.warning("Converted to jet dicts")
-    save_jets_to_pickle(jets, os.path.join(preprocessed_dir, filename))
-
+    logging.warning("Loaded {} raw jets in {:.1f} seconds".format(len(X), time.time() - t))
+
+    # each chunk is converted and written to its own store by a worker,
+    # then the chunk stores are concatenated in order
+    chunks_dir = store_path(os.path.join(preprocessed_dir, filename)) + '.chunks'
+    if os.path.exists(chunks_dir):
+        shutil.rmtree(chunks_dir)
+    os.makedirs(chunks_dir)
+    tasks = (
+        (os.path.join(chunks_dir, '{:06d}'.format(i)), X[start:start + chunk_size], Y[start:start + chunk_size])
+        for i, start in enumerate(range(0, len(X), chunk_size))
+        )
+
+    t = time.time()
+    chunk_paths = []
+    worker_time = 0.
+    for chunk_path, n, elapsed in parallel_map(convert_chunk, tasks, n_workers):
+        chunk_paths.append(chunk_path)
+        worker_time += elapsed
+    t_convert = time.time() - t
+    logging.warning("Converted to jet dicts in {:.1f} seconds ({} chunks, {} workers, {:.1f} worker-seconds)".format(t_convert, len(chunk_paths), n_workers, worker_time))
+
+    t = time.time()
+    write_jet_store(store_path(os.path.join(preprocessed_dir, filename)), [JetStore(path) for path in chunk_paths])
+    shutil.rmtree(chunks_dir)
+    logging.warning("Merged chunks in {:.1f} seconds".format(time.time() - t))
 
     return None
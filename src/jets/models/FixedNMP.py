@@ -14,6 +14,8 @@ from src.architectures.nmp.message_passing import MP_LAYERS
 #from ..message_passing.adjacency import construct_adjacency_matrix_layer
 
 from src.architectures.nmp.adjacency import construct_adjacency
+from src.architectures.nmp.adjacency.sparse import EdgeList
+from src.architectures.utils import run_layers
 from src.architectures.readout import READOUTS
 from src.architectures.embedding import EMBEDDINGS
 
@@ -34,6 +36,9 @@ class FixedNMP(nn.Module):
         mp_layer=None,
         tied=False,
         no_grad=False,
+        adj_sparse=None,
+        adj_radius=None,
+        checkpoint_every=None,
         **kwargs
         ):
 
@@ -41,6 +46,11 @@ class FixedNMP(nn.Module):
 
         self.iters = iters
         self.no_grad = no_grad
+        # message passing on an edge list of nearest neighbours, see adjacency/sparse.py
+        self.sparse = adj_sparse is not None or adj_radius is not None
+        self.adj_sparse = adj_sparse
+        self.adj_radius = adj_radius
+        self.checkpoint_every = checkpoint_every
         emb_kwargs = {x: kwargs.get(x, None) for x in ['act', 'wn']}
         self.embedding = EMBEDDINGS['n'](dim_in=features, dim_out=hidden, n_layers=int(emb_init), **emb_kwargs)
 
@@ -53,19 +63,35 @@ class FixedNMP(nn.Module):
             self.mp_layers = nn.ModuleList([MPLayer(hidden=hidden,**mp_kwargs) for _ in range(iters)])
 
         Readout = READOUTS[readout]
-        adj_kwargs = {x: kwargs.get(x, None) for x in ['symmetric', 'logger', 'logging_frequency', 'wn']}
+        adj_kwargs = {x: kwargs.get(x, None) for x in ['symmetric', 'logger', 'logging_frequency', 'wn', 'alpha', 'R']}
         adj_kwargs['act'] = kwargs['m_act']
+        adj_kwargs['n_heads'] = kwargs.get('adj_heads', None) or 1
         self.adjacency_matrix = construct_adjacency(matrix=matrix, dim_in=features, dim_out=hidden, **adj_kwargs)
         self.readout = Readout(hidden, hidden)
 
         self.predictor = READOUTS['clf'](hidden, None)
 
     def forward(self, x, **kwargs):
-        jets, mask = x
+        jets, mask = x[:2]
         h = self.embedding(jets)
-        dij = self.adjacency_matrix(jets, mask=mask, **kwargs)
-        for mp in self.mp_layers:
-            h = mp(h=h, A=dij)
+        if len(x) > 2:
+            # fixed adjacency cached by the loader, see AdjacencyCache.py
+            dij = x[2]
+        elif self.sparse:
+            dij = self.adjacency_matrix.sparse_forward(jets, mask=mask, k=self.adj_sparse, radius=self.adj_radius)
+        else:
+            dij = self.adjacency_matrix(jets, mask=mask, **kwargs)
+        h = self.message_passing(h, dij)
         out = self.readout(h)
         outputs = self.predictor(out)
         return outputs
+
+    def message_passing(self, h, dij):
+        # the adjacency goes through run_layers as an input, see checkpoint.py
+        if isinstance(dij, EdgeList):
+            inputs, make_adjacency = (dij.values,), dij.with_values
+        else:
+            inputs, make_adjacency = (dij,), lambda A: A
+        step = lambda mp, state, inputs: (mp(h=state[0], A=make_adjacency(inputs[0])),)
+        h, = run_layers(self.mp_layers, step, (h,), inputs, self.checkpoint_every)
+        return h
@@ -10,6 +10,7 @@ from .....architectures.embedding import EMBEDDINGS
 from .attention_pooling import POOLING_LAYERS
 from ..message_passing import MP_LAYERS
 from ..adjacency import construct_adjacency
+from .....architectures.utils import run_layers
 
 from .....monitors import BatchMatrixMonitor
 from .....monitors import Histogram
@@ -27,10 +28,12 @@ class AbstractStackedFixedNMP(nn.Module):
         pool_first=False,
         mp_layer=None,
         emb_init=None,
+        checkpoint_every=None,
         **kwargs
         ):
 
         super().__init__()
+        self.checkpoint_every = checkpoint_every
         emb_kwargs = {x: kwargs[x] for x in ['act', 'wn']}
         self.embedding = EMBEDDINGS['n'](dim_in=features, dim_out=hidden, n_layers=int(emb_init), **emb_kwargs)
 
@@ -101,8 +104,8 @@ class StackedFixedNMP(AbstractStackedFixedNMP):
                 h, attns = pool(h, **kwargs)
 
             #dij = adj(h, mask=mask)
-            for mp in nmp:
-                h = mp(h=h, mask=mask, dij=dij)
+            step = lambda mp, state, inputs: (mp(h=state[0], mask=mask, dij=inputs[0]),)
+            h, = run_layers(nmp, step, (h,), (dij,), self.checkpoint_every)
 
             if not self.pool_first:
                 h, attns = pool(h, **kwargs)
@@ -10,8 +10,14 @@ from src.misc.constants import DATASETS
 
 from src.utils._Evaluation import _Evaluation
 
+from src.data_ops.wrapping import unwrap
+from src.data_ops.Prefetcher import prefetch
+from src.data_ops.BatchCache import cache_batches
+
 from .data_ops.load_dataset import load_test_dataset
 from .data_ops.ProteinLoader import ProteinLoader as DataLoader
+from .data_ops.adjacency import contact_mask
+from .data_ops.cropping import predict_in_windows
 from .models import ModelBuilder
 from .Administrator import Administrator
 
@@ -78,8 +84,17 @@ class Evaluation(_Evaluation):
     def load_data(self,dataset, data_dir, n_test,  batch_size, preprocess, **kwargs):
         intermediate_dir, data_filename = DATASETS[dataset]
         data_dir = os.path.join(data_dir, intermediate_dir)
-        dataset = load_test_dataset(data_dir, data_filename,n_test, preprocess)
-        data_loader = DataLoader(dataset, batch_size, **kwargs)
+        dataset = load_test_dataset(data_dir, data_filename,n_test, preprocess, self.data_args.pp_workers)
+        # test proteins are covered in full by windows, see test_one_model
+        kwargs.pop('crop_len', None)
+        data_loader = DataLoader(dataset, batch_size, shuffle=False, **kwargs)
+        data_loader = cache_batches(
+            data_loader,
+            self.data_args.cache_batches,
+            self.data_args.cache_budget,
+            self.data_args.cache_device,
+            self.data_args.cache_dir
+            )
         return data_loader
 
     def loss(self, y_pred, y, mask):
@@ -89,14 +104,16 @@ class Evaluation(_Evaluation):
         model.eval()
 
         valid_loss = 0.
+        n_examples = 0
         yy, yy_pred = [], []
-        for i, (x, x_mask, y, y_mask) in enumerate(data_loader):
-            y_pred = model(x, mask=x_mask)
-            vl = self.loss(y_pred, y, y_mask); valid_loss += float(unwrap(vl))
+        for i, (x, x_mask, y, y_mask) in enumerate(prefetch(data_loader, self.data_args.prefetch)):
+            y_mask = contact_mask(x_mask, y_mask)
+            y_pred = predict_in_windows(model, x, x_mask, self.data_args.crop_len)
+            vl = self.loss(y_pred, y, y_mask); valid_loss += float(unwrap(vl)) * len(y); n_examples += len(y)
             yy.append(unwrap(y))
             yy_pred.append(unwrap(y_pred))
 
-        valid_loss /= len(data_loader)
+        valid_loss /= max(n_examples, 1)
         logdict = dict(
             yy=yy,
             yy_pred=yy_pred,
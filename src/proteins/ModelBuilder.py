@@ -46,6 +46,7 @@ class ModelBuilder(_ModelBuilder):
             'wn': args.wn,
             'no_grad': args.no_grad,
             'tied': args.tied,
+            'checkpoint_every': args.checkpoint_every,
 
             # Stacked NMP
             'scales': args.scales,
@@ -8,8 +8,12 @@ import torch.nn.functional as F
 
 from .data_ops.load_dataset import load_train_dataset
 from .data_ops.ProteinLoader import ProteinLoader as DataLoader
+from .data_ops.adjacency import contact_mask
+from .data_ops.cropping import predict_in_windows
 
 from src.data_ops.wrapping import unwrap
+from src.data_ops.Prefetcher import prefetch
+from src.data_ops.BatchCache import cache_batches
 
 from src.misc.constants import DATASETS
 
@@ -78,13 +82,31 @@ class Training(_Training):
     def load_data(self,dataset, data_dir, n_train, n_valid, batch_size, preprocess, **kwargs):
         intermediate_dir, data_filename = DATASETS[dataset]
         data_dir = os.path.join(data_dir, intermediate_dir)
-        train_dataset, valid_dataset = load_train_dataset(data_dir, data_filename,n_train, n_valid, preprocess)
-        train_data_loader = DataLoader(train_dataset, batch_size, **kwargs)
-        valid_data_loader = DataLoader(valid_dataset, batch_size, **kwargs)
+        train_dataset, valid_dataset = load_train_dataset(data_dir, data_filename,n_train, n_valid, preprocess, self.data_args.pp_workers)
+        loader_args = dict(
+            bucket_size=self.data_args.bucket_size,
+            max_n2=self.data_args.max_n2,
+            num_workers=self.data_args.num_workers,
+            pin_memory=self.data_args.pin_memory,
+            token_budget=self.data_args.token_budget,
+            budget_mode=self.data_args.budget_mode
+            )
+        train_data_loader = DataLoader(train_dataset, batch_size, crop_len=self.data_args.crop_len, **loader_args, **kwargs)
+        valid_data_loader = DataLoader(valid_dataset, batch_size, shuffle=False, **loader_args, **kwargs)
+        valid_data_loader = cache_batches(
+            valid_data_loader,
+            self.data_args.cache_batches,
+            self.data_args.cache_budget,
+            self.data_args.cache_device,
+            self.data_args.cache_dir
+            )
 
         return train_data_loader, valid_data_loader
 
 
+    def batch_size(self, batch):
+        return len(batch[2])
+
     def loss(self, y_pred, y, mask):
         return F.binary_cross_entropy(y_pred * mask, y * mask)
 
@@ -93,11 +115,13 @@ class Training(_Training):
         model.eval()
 
         valid_loss = 0.
+        n_examples = 0
         yy, yy_pred = [], []
         mask = []
-        for i, (x, x_mask, y, y_mask) in enumerate(data_loader):
-            y_pred = model(x, mask=x_mask)
-            vl = self.loss(y_pred, y, y_mask); valid_loss += float(unwrap(vl))
+        for i, (x, x_mask, y, y_mask) in enumerate(prefetch(data_loader, self.data_args.prefetch)):
+            y_mask = contact_mask(x_mask, y_mask)
+            y_pred = predict_in_windows(model, x, x_mask, self.data_args.crop_len)
+            vl = self.loss(y_pred, y, y_mask); valid_loss += float(unwrap(vl)) * self.batch_size((x, x_mask, y, y_mask)); n_examples += self.batch_size((x, x_mask, y, y_mask))
             yy.append(unwrap(y))
             yy_pred.append(unwrap(y_pred))
             mask.append(unwrap(y_mask))
@@ -108,7 +132,8 @@ class Training(_Training):
         #    y_pred_matrix_monitor(matrix=y_pred)
         #    y_pred_matrix_monitor.visualize('epoch-{}/{}'.format(epoch, 'y_pred'), n=10)
 
-        valid_loss /= len(data_loader)
+        # batches vary in size under a token budget, so weight by examples
+        valid_loss /= max(n_examples, 1)
 
         t1=time.time()
 
@@ -131,6 +156,7 @@ class Training(_Training):
     def train_one_batch(self,model, batch, optimizer, administrator, epoch, batch_number, clip):
         logger = administrator.logger
         (x, x_mask, y, y_mask) = batch
+        y_mask = contact_mask(x_mask, y_mask)
 
         # forward
         model.train()
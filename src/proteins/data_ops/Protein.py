@@ -13,6 +13,8 @@ class Protein:
             secondary=None,
             tertiary=None,
             mask=None,
+            contacts=None,
+            features=None,
             **kwargs
             ):
         self.class_id=class_id
@@ -24,6 +26,10 @@ class Protein:
         self.secondary=secondary
         self.tertiary=tertiary
         self.mask=mask
+        # (pairs, near_origin), see adjacency.contact_pairs
+        self.contacts=contacts
+        # primary next to evolutionary, when already stored that way
+        self.features=features
 
     def __len__(self):
         return len(self.primary)
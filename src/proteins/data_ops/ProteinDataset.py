@@ -3,6 +3,8 @@ from torch.utils.data import Dataset as D
 import numpy as np
 import math
 
+from .ProteinStore import ProteinStore
+
 class ProteinDataset(D):
     def __init__(self, proteins, weights=None, problem=None, subproblem=None):
         super().__init__()
@@ -15,11 +17,20 @@ class ProteinDataset(D):
         return len(self.proteins)
 
     def __getitem__(self, idx):
-        x = np.concatenate([self.proteins[idx].primary, self.proteins[idx].evolutionary], 1)
-        y = self.proteins[idx].tertiary
-        mask = self.proteins[idx].mask
+        # stored in the dtypes of the preprocessed pickles, cast once here
+        x = self.proteins[idx].features
+        if x is None:
+            x = np.concatenate([self.proteins[idx].primary, self.proteins[idx].evolutionary], 1)
+        x = np.asarray(x, dtype=np.float32)
+        y = self.proteins[idx].contacts
+        mask = np.asarray(self.proteins[idx].mask, dtype=np.float32)
         return x, y, mask
 
+    def lengths(self):
+        if isinstance(self.proteins, ProteinStore):
+            return self.proteins.lengths()
+        return np.array([len(p) for p in self.proteins])
+
     def shuffle(self):
         perm = np.random.permutation(len(self.proteins))
         self.proteins = [self.proteins[i] for i in perm]
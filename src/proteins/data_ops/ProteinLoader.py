@@ -7,49 +7,37 @@ from torch.autograd import Variable
 
 from src.data_ops._DataLoader import _DataLoader
 from src.data_ops.pad_tensors import pad_tensors, pad_tensors_extra_channel
-from src.data_ops.dropout import dropout
-from src.data_ops.wrapping import wrap
-from .adjacency import compute_adjacency, contact_map
+from .adjacency import dense_contact_maps
+from .cropping import random_crop
 from .preprocessing import make_mask
 
 class ProteinLoader(_DataLoader):
-    def __init__(self, dataset, batch_size, dropout=None, permute_vertices=None):
-        super().__init__(dataset, batch_size)
+    def __init__(self, dataset, batch_size, dropout=None, permute_vertices=None, bucket_size=None, max_n2=None, num_workers=0, pin_memory=False, crop_len=None, token_budget=None, budget_mode='n2', shuffle=True, **kwargs):
+        super().__init__(dataset, batch_size, bucket_size, max_n2, num_workers, pin_memory, token_budget, budget_mode, shuffle)
         self.dropout = dropout
         self.permute_vertices = permute_vertices
-        #self.n_max = 100
-        self.n_max = None
+        # random window of at most crop_len residues per protein (see cropping.py)
+        self.crop_len = crop_len
 
 
     def collate(self, data_tuples):
         t = time.time()
-        X, X_mask = self.preprocess_x([x for x, _, _ in data_tuples])
-        Y = self.preprocess_y([y for _, y, _ in data_tuples])
+        if self.crop_len is not None:
+            data_tuples = [random_crop(x, y, mask, self.crop_len) for x, y, mask in data_tuples]
+        X, X_lengths = self.preprocess_x([x for x, _, _ in data_tuples])
+        Y = self.preprocess_y([y for _, y, _ in data_tuples], X_lengths, X.size(1))
+        # per-residue mask; the target mask is built on device by contact_mask
         Y_mask = self.preprocess_mask([mask for _, _, mask in data_tuples])
-        Y_mask *= X_mask
 
-        if self.n_max is not None:
-            X = X[:, :self.n_max]
-            X_mask = X_mask[:, :self.n_max, :self.n_max]
-            Y = Y[:, :self.n_max, :self.n_max]
-            Y_mask = Y_mask[:, :self.n_max, :self.n_max]
-
-        return X, X_mask, Y, Y_mask
+        return X, X_lengths, Y, Y_mask
 
     def preprocess_mask(self, mask_list):
         mask = [torch.from_numpy(mask) for mask in mask_list]
         mask, _ = pad_tensors(mask)
-        mask = 1 - torch.bmm(mask,torch.transpose(mask, 1,2))
-        mask = wrap(mask)
         return mask
 
-    def preprocess_y(self, y_list):
-        y_list = [torch.from_numpy(y) for y in y_list]
-        y,_ = pad_tensors(y_list)
-        y = compute_adjacency(y)
-        y = contact_map(y, threshold=800)
-        y = wrap(y)
-        return y
+    def preprocess_y(self, y_list, lengths, n):
+        return dense_contact_maps(y_list, lengths, n)
 
     def preprocess_x(self, x_list):
 
@@ -58,11 +46,5 @@ class ProteinLoader(_DataLoader):
         else:
             data = [torch.from_numpy(x) for x in x_list]
 
-        #if self.dropout is not None:
-        #    data = dropout(data, self.dropout)
-
-        data, mask = pad_tensors_extra_channel(data)
-
-        data = wrap(data)
-        mask = wrap(mask)
-        return data, mask
+        data, lengths = pad_tensors_extra_channel(data)
+        return data, lengths
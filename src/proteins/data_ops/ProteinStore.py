@@ -0,0 +1,167 @@
+import os
+import shutil
+import numpy as np
+
+from .Protein import Protein
+from .adjacency import contact_pairs
+
+'''
+On-disk array format for preprocessed proteins, the protein counterpart of
+src/jets/data_ops/JetStore.py.
+
+A store is a directory of .npy files:
+    primary, evolutionary, tertiary, mask, residue_offsets <- ragged
+        (total_residues) * 20, * 21, * 3 * 3 and * 1 arrays sharing one set of
+        (n_proteins + 1) offsets, each in the dtype of the preprocessed
+        pickles (int64 one-hot columns, float64 values), so that a protein
+        read back from a store equals its pickled dict
+    contact_pairs, contact_offsets <- ragged (total_contacts) * 2 residue pairs
+    near_origin, near_origin_offsets <- see adjacency.contact_pairs
+
+Stores written before this layout hold one float32 features column (primary
+next to evolutionary) instead of primary and evolutionary; they are still
+read. Columns are memory-mapped, so a Protein from a store holds views into
+the files and nothing is copied until a batch is collated, where it is cast
+to float32 (see ProteinDataset).
+'''
+
+STORE_EXTENSION = '.proteins'
+
+RESIDUE_FIELDS = ['primary', 'evolutionary', 'tertiary', 'mask']
+
+PRIMARY_DIM = 20
+
+def store_path(filename):
+    return os.path.splitext(filename)[0] + STORE_EXTENSION
+
+def store_exists(filename):
+    return os.path.isdir(store_path(filename))
+
+def _columns(pd):
+    return {name: np.asarray(pd[name]) for name in RESIDUE_FIELDS}
+
+def _write_npy(path, raw_path, dtype, shape):
+    ''' Turn a file of raw C-order values into an .npy file: header, then the values '''
+    header = dict(descr=np.lib.format.dtype_to_descr(np.dtype(dtype)), fortran_order=False, shape=shape)
+    with open(path, 'wb') as f:
+        np.lib.format.write_array_header_1_0(f, header)
+        with open(raw_path, 'rb') as raw:
+            shutil.copyfileobj(raw, f, 2 ** 24)
+    os.remove(raw_path)
+
+def write_protein_store(path, protein_dicts):
+    '''
+    Write an iterable of protein dicts to a store at path, computing their
+    contacts (see adjacency.contact_pairs) if missing, in a single pass: each
+    protein is appended to raw column files as it comes, so a generator of
+    parsed proteins is never held in memory. The raw files get their .npy
+    headers once the sizes are known.
+    '''
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    dtypes = dict(contact_pairs=np.int32, near_origin=np.int32)
+    raw_paths = {name: os.path.join(path, name + '.raw') for name in RESIDUE_FIELDS + list(dtypes)}
+    shapes = dict(contact_pairs=(2,), near_origin=())
+    offsets = {name: [0] for name in ['residue_offsets', 'contact_offsets', 'near_origin_offsets']}
+
+    files = {name: open(raw_path, 'wb') for name, raw_path in raw_paths.items()}
+    try:
+        for pd in protein_dicts:
+            for name, x in _columns(pd).items():
+                shapes.setdefault(name, x.shape[1:])
+                dtypes.setdefault(name, x.dtype)
+                files[name].write(np.ascontiguousarray(x, dtype=dtypes[name]).tobytes())
+            offsets['residue_offsets'].append(offsets['residue_offsets'][-1] + len(pd['primary']))
+
+            contacts = pd.get('contacts', None)
+            pairs, near_origin = contacts if contacts is not None else contact_pairs(pd['tertiary'])
+            files['contact_pairs'].write(np.ascontiguousarray(pairs, dtype=np.int32).tobytes())
+            offsets['contact_offsets'].append(offsets['contact_offsets'][-1] + len(pairs))
+            files['near_origin'].write(np.ascontiguousarray(near_origin, dtype=np.int32).tobytes())
+            offsets['near_origin_offsets'].append(offsets['near_origin_offsets'][-1] + len(near_origin))
+    finally:
+        for f in files.values():
+            f.close()
+
+    sizes = dict(contact_pairs='contact_offsets', near_origin='near_origin_offsets')
+    for name, raw_path in raw_paths.items():
+        if name not in shapes:
+            # no proteins, so the residue columns have no known width
+            os.remove(raw_path)
+            continue
+        n = offsets[sizes.get(name, 'residue_offsets')][-1]
+        _write_npy(os.path.join(path, name + '.npy'), raw_path, dtypes[name], (n,) + tuple(shapes[name]))
+    for name, offset in offsets.items():
+        np.save(os.path.join(path, name + '.npy'), np.asarray(offset, dtype=np.int64))
+
+    return path
+
+
+class ProteinStore:
+    '''
+    Sequence of proteins backed by a store. Indexing with an int returns a
+    Protein whose arrays are memory-mapped views; indexing with a slice or an
+    index array returns another ProteinStore over the same columns.
+    '''
+    def __init__(self, path, indices=None, columns=None):
+        self.path = path
+        if columns is None:
+            columns = {}
+            for fn in os.listdir(path):
+                name, ext = os.path.splitext(fn)
+                if ext == '.npy':
+                    columns[name] = np.load(os.path.join(path, fn), mmap_mode='r')
+        self.columns = columns
+        self.n_total = len(columns['residue_offsets']) - 1
+        self.indices = np.arange(self.n_total) if indices is None else np.asarray(indices, dtype=np.int64)
+
+    def __getstate__(self):
+        # reopen the memmaps on the other side instead of pickling them by value
+        return dict(path=self.path, indices=self.indices)
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['indices'])
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (slice, list, np.ndarray)):
+            return ProteinStore(self.path, self.indices[idx], self.columns)
+        j = int(self.indices[idx])
+        c = self.columns
+
+        start, end = c['residue_offsets'][j], c['residue_offsets'][j+1]
+        if 'features' in c:
+            features = c['features'][start:end]
+            primary, evolutionary = features[:, :PRIMARY_DIM], features[:, PRIMARY_DIM:]
+        else:
+            features = None
+            primary, evolutionary = c['primary'][start:end], c['evolutionary'][start:end]
+        contacts = (
+            c['contact_pairs'][c['contact_offsets'][j]:c['contact_offsets'][j+1]],
+            c['near_origin'][c['near_origin_offsets'][j]:c['near_origin_offsets'][j+1]],
+        )
+        return Protein(
+            primary=primary,
+            evolutionary=evolutionary,
+            features=features,
+            tertiary=c['tertiary'][start:end],
+            mask=c['mask'][start:end],
+            contacts=contacts,
+        )
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def lengths(self):
+        offsets = self.columns['residue_offsets']
+        return np.asarray(offsets[self.indices + 1] - offsets[self.indices])
@@ -1,5 +1,6 @@
 import numpy as np
 import torch
+from src.data_ops.masks import apply_mask
 
 def compute_adjacency_exponential(coords, sigma=200):
     bs, n_vertices, n_atoms, space_dim = coords.shape
@@ -24,3 +25,54 @@ def compute_adjacency(coords):
 
 def contact_map(adjacency, threshold):
     return (adjacency < threshold).float()
+
+CONTACT_THRESHOLD = 800
+
+def contact_pairs(tertiary, threshold=CONTACT_THRESHOLD):
+    '''
+    Sparse contact map of one protein, from its (N, 3 coords, 3 atoms)
+    tertiary array, using atom 1 like compute_adjacency.
+    Returns
+        pairs <- (n_contacts, 2) residue pairs closer than threshold
+        near_origin <- residues closer than threshold to the origin, which
+            is where padded residues sit once a batch is padded
+    '''
+    coords = tertiary[:, :, 1]
+    pairs = []
+    # one block of rows at a time keeps the distance matrix small
+    for start in range(0, len(coords), 256):
+        d = np.sqrt(((coords[start:start + 256, None] - coords[None]) ** 2).sum(-1))
+        rows, columns = np.where(d < threshold)
+        pairs.append(np.stack([rows + start, columns], 1))
+    pairs = np.concatenate(pairs, 0).astype(np.int32) if len(pairs) > 0 else np.zeros((0, 2), dtype=np.int32)
+    near_origin = np.where(np.sqrt((coords ** 2).sum(-1)) < threshold)[0].astype(np.int32)
+    return pairs, near_origin
+
+def dense_contact_maps(contacts, lengths, n):
+    '''
+    (batch_size) * n * n contact maps from sparse (pairs, near_origin)
+    contacts. Padded entries get the values the thresholded distances of
+    zero-padded coordinates would have had.
+    '''
+    y = torch.zeros(len(contacts), n, n)
+    for i, ((pairs, near_origin), length) in enumerate(zip(contacts, lengths)):
+        length = int(length)
+        if len(pairs) > 0:
+            flat = torch.from_numpy(pairs[:, 0].astype(np.int64) * n + pairs[:, 1])
+            y[i].view(-1).index_fill_(0, flat, 1)
+        if length < n:
+            y[i, length:, length:] = 1
+            if len(near_origin) > 0:
+                near_origin = torch.from_numpy(near_origin.astype(np.int64))
+                y[i, length:].index_fill_(1, near_origin, 1)
+                y[i, :, length:].index_fill_(0, near_origin, 1)
+    return y
+
+def contact_mask(lengths, residue_mask):
+    '''
+    Mask for the contact map loss, built on the device the batch lives on.
+        lengths <- (batch_size) number of residues
+        residue_mask <- (batch_size) * N * 1 padded per-residue mask
+    '''
+    mask = 1 - torch.bmm(residue_mask, residue_mask.transpose(1, 2))
+    return apply_mask(mask, lengths)
@@ -0,0 +1,67 @@
+import numpy as np
+import torch
+
+from src.data_ops.wrapping import unwrap, wrap
+
+'''
+Crop windows for long proteins.
+
+Training sees one random contiguous window of at most crop_len residues per
+protein, cut before padding and target construction, so batch memory is
+bounded by crop_len ** 2. At evaluation time a full-length protein is cut
+into blocks of crop_len // 2 residues, and the model runs on every pair of
+blocks put side by side. Each pass predicts the four block pairs it holds,
+so every residue pair, however far apart, is predicted at least once, and
+predictions are averaged where passes overlap (the blocks on the diagonal).
+'''
+
+def crop_contacts(contacts, start, end):
+    pairs, near_origin = contacts
+    keep = ((pairs >= start) & (pairs < end)).all(1)
+    pairs = pairs[keep] - start
+    near_origin = near_origin[(near_origin >= start) & (near_origin < end)] - start
+    return pairs, near_origin
+
+def random_crop(x, contacts, mask, crop_len):
+    n = len(x)
+    if n <= crop_len:
+        return x, contacts, mask
+    start = np.random.randint(0, n - crop_len + 1)
+    end = start + crop_len
+    return x[start:end], crop_contacts(contacts, start, end), mask[start:end]
+
+def block_starts(n, block_len):
+    ''' Starts of the consecutive blocks of block_len residues covering all n residues '''
+    return list(range(0, n, max(block_len, 1)))
+
+def predict_in_windows(model, x, lengths, crop_len, **kwargs):
+    '''
+    Contact predictions for a padded (batch_size) * N * F batch, running the
+    model on pairs of blocks of at most crop_len residues in all and stitching
+    the (batch_size) * N * N prediction back together.
+    '''
+    bs, n = x.size()[:2]
+    if crop_len is None or n <= crop_len:
+        return model(x, mask=lengths, **kwargs)
+
+    block_len = max(crop_len // 2, 1)
+    starts = block_starts(n, block_len)
+    prediction = np.zeros((bs, n, n), dtype=np.float32)
+    count = np.zeros((n, n), dtype=np.float32)
+    for k, a in enumerate(starts):
+        for b in starts[k + 1:]:
+            a_end, b_end = min(a + block_len, n), min(b + block_len, n)
+            la = a_end - a
+            # the real residues stay a prefix: block a is full whenever the
+            # protein reaches block b, and at least one residue keeps it finite
+            in_b = (lengths > b).type_as(lengths)
+            window_lengths = in_b * (la + (lengths - b).clamp(min=0, max=b_end - b)) \
+                + (1 - in_b) * (lengths - a).clamp(min=1, max=la)
+            x_window = torch.cat([x[:, a:a_end], x[:, b:b_end]], 1)
+            y_window = unwrap(model(x_window, mask=window_lengths, **kwargs))
+            for (i, i_end, wi) in [(a, a_end, 0), (b, b_end, la)]:
+                for (j, j_end, wj) in [(a, a_end, 0), (b, b_end, la)]:
+                    prediction[:, i:i_end, j:j_end] += y_window[:, wi:wi + i_end - i, wj:wj + j_end - j]
+                    count[i:i_end, j:j_end] += 1
+    prediction /= np.maximum(count, 1)
+    return wrap(torch.from_numpy(prediction))
@@ -1,6 +1,7 @@
 import pickle
 import os
 from .Protein import Protein
+from .ProteinStore import ProteinStore, write_protein_store, store_path
 
 def save_proteins_to_pickle(proteins, filename):
     protein_dicts = [vars(protein) for protein in proteins]
@@ -23,6 +24,17 @@ def load_proteins_from_pickle(filename):
     proteins = [Protein(**jd) for jd in protein_dicts]
     return proteins
 
+def save_protein_dicts_to_store(protein_dicts, filename):
+    return write_protein_store(store_path(filename), protein_dicts)
+
+def load_proteins_from_store(filename):
+    return ProteinStore(store_path(filename))
+
+def convert_pickle_to_store(filename):
+    ''' One-shot conversion of a preprocessed list-of-dicts pickle to an array store '''
+    protein_dicts = load_protein_dicts_from_pickle(filename)
+    return save_protein_dicts_to_store(protein_dicts, filename)
+
 def robust_pickle_dump(data, fn):
     file_path = fn
     max_bytes = 2**31 - 1
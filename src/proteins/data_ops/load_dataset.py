@@ -4,11 +4,13 @@ import time
 import pickle
 import numpy as np
 
-from .io import load_proteins_from_pickle, save_proteins_to_pickle
+from .io import load_proteins_from_pickle, save_proteins_to_pickle, load_proteins_from_store
+from .ProteinStore import store_exists
 from .ProteinDataset import ProteinDataset
 from .preprocessing import preprocess
+from .adjacency import contact_pairs
 
-def load_proteins(data_dir, filename, redo=False):
+def load_proteins(data_dir, filename, redo=False, n_workers=None):
     #preprocessed_dir = os.path.join(data_dir, 'preprocessed')
 
     raw_data_dir = os.path.join(data_dir, 'raw')
@@ -16,32 +18,45 @@ def load_proteins(data_dir, filename, redo=False):
     path_to_preprocessed = os.path.join(preprocessed_dir, filename)
 
     #import ipdb; ipdb.set_trace()
-    if not os.path.exists(path_to_preprocessed) or redo:
+    preprocessed = store_exists(path_to_preprocessed) or os.path.exists(path_to_preprocessed)
+    if not preprocessed or redo:
         if not os.path.exists(preprocessed_dir):
             os.makedirs(preprocessed_dir)
 
         logging.info("Preprocessing...")
 
-        preprocess(raw_data_dir, preprocessed_dir, filename)
+        preprocess(raw_data_dir, preprocessed_dir, filename, n_workers=n_workers)
 
         logging.info("\tPreprocessed the data and saved it to {}".format(path_to_preprocessed))
     else:
         logging.info("\tData already preprocessed")
 
     t = time.time()
-    proteins = load_proteins_from_pickle(path_to_preprocessed)
+    if store_exists(path_to_preprocessed):
+        proteins = load_proteins_from_store(path_to_preprocessed)
+    else:
+        logging.warning("No array store for {}, falling back to pickle (see src/scripts/convert_proteins.py)".format(path_to_preprocessed))
+        proteins = load_proteins_from_pickle(path_to_preprocessed)
     logging.info("\tData loaded in {:.1f} seconds".format(time.time() - t))
+
+    # data preprocessed before contact maps were stored
+    missing = [p for p in proteins if p.contacts is None] if isinstance(proteins, list) else []
+    if len(missing) > 0:
+        t = time.time()
+        for p in missing:
+            p.contacts = contact_pairs(p.tertiary)
+        logging.info("\tComputed {} missing contact maps in {:.1f} seconds (convert to a store to keep them)".format(len(missing), time.time() - t))
     return proteins
 
 
-def load_train_dataset(data_dir, filename, n_train, n_valid, redo):
+def load_train_dataset(data_dir, filename, n_train, n_valid, redo, n_workers=None):
     problem = data_dir.split('/')[-1]
     subproblem = filename
 
     logging.info("Loading data...")
 
     train_filename = "{}-train.pickle".format(filename)
-    train_proteins = load_proteins(data_dir, train_filename, redo)
+    train_proteins = load_proteins(data_dir, train_filename, redo, n_workers)
     if n_train > 0:
         train_proteins = train_proteins[:n_train]
     train_dataset = ProteinDataset(train_proteins, problem=problem, subproblem=subproblem)
@@ -58,14 +73,14 @@ def load_train_dataset(data_dir, filename, n_train, n_valid, redo):
 
     return train_dataset, valid_dataset
 
-def load_test_dataset(data_dir, filename, n_test, redo):
+def load_test_dataset(data_dir, filename, n_test, redo, n_workers=None):
     problem = data_dir.split('/')[-1]
     subproblem = filename
 
     logging.info("Loading test data...")
 
     test_filename = "{}-train.pickle".format(filename)
-    test_proteins = load_proteins(data_dir, test_filename, redo)
+    test_proteins = load_proteins(data_dir, test_filename, redo, n_workers)
     test_dataset = ProteinDataset(test_proteins, problem=problem, subproblem=subproblem)
 
     # add cropped indices to training data
@@ -1,10 +1,14 @@
 import os
+import mmap
+import time
 import string
 import numpy as np
 import torch
 import logging
 
-from .io import save_protein_dicts_to_pickle
+from src.data_ops.parallel import parallel_map, chunks
+
+from .io import save_protein_dicts_to_store
 from .adjacency import compute_adjacency
 
 def string_vectorizer(strng, alphabet=string.ascii_uppercase):
@@ -12,6 +16,24 @@ def string_vectorizer(strng, alphabet=string.ascii_uppercase):
                   for letter in strng]
     return vector
 
+def one_hot_table(alphabet):
+    ''' Byte -> one hot row lookup table, equivalent to string_vectorizer '''
+    table = np.zeros((256, len(alphabet)), dtype=np.int64)
+    for i, letter in enumerate(alphabet):
+        table[ord(letter), i] = 1
+    return table
+
+UPPERCASE_TABLE = one_hot_table(string.ascii_uppercase)
+MASK_TABLE = one_hot_table(['+'])
+
+def one_hot(strng, table):
+    return table[np.frombuffer(strng.encode('latin-1'), dtype=np.uint8)]
+
+def parse_numeric_lines(lines):
+    ''' Tab-separated lines of floats -> (n_lines, n_values) float64 array, in one pass '''
+    values = np.fromstring('\t'.join(lines), dtype=np.float64, sep='\t')
+    return values.reshape(len(lines), -1)
+
 def make_mask(masktext):
     #v = string_vectorizer(masktext, ['+'])
     #np.array(v)
@@ -21,35 +43,31 @@ def make_mask(masktext):
     matrix_mask = torch.mm(mask,torch.transpose(mask, 0, 1))
     return matrix_mask.numpy()
 
-def process_textfile(contents):
-    protein_contents = []
-
-    line_index = 0
-    contents = [''] + contents
-    #import ipdb; ipdb.set_trace()
-    protein_dicts = []
-    n = 0
-    protein_entry = None
-    last_line = None
-    for i, line in enumerate(contents):
-
-        if len(line) == 0 and i < len(contents) - 1:
-            if protein_entry is not None:
-                protein_dict = convert_to_protein_dict(protein_entry)
-                protein_dicts.append(protein_dict)
-                n+=1
-                if n % 500 == 0:
-                    print("Processed {} proteins".format(n))
-                #if len(protein_dicts) > 5:
-                #    break
-            protein_entry = []
-        else:
-            protein_entry.append(line)
-
-        last_line = line
-
-    print("Processed {} proteins in total".format(n))
-    return protein_dicts
+def iter_protein_records(filename):
+    '''
+    Stream the records of a ProteinNet text file as lists of stripped lines.
+    Records are separated by blank lines. As in the original list-based
+    parser, a record is only complete once a blank line follows it, and the
+    very last line of the file never closes one. The file is memory-mapped,
+    so only the current record is held in memory.
+    '''
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            entry = []
+            for raw in iter(mm.readline, b''):
+                line = raw.decode().strip()
+                is_last = not raw.endswith(b'\n')
+                if len(line) == 0 and not is_last:
+                    if len(entry) > 0:
+                        yield entry
+                    entry = []
+                else:
+                    entry.append(line)
+        finally:
+            mm.close()
 
 def convert_to_protein_dict(entry_text):
     #entry = entry_text.split('\n')
@@ -103,56 +121,62 @@ def convert_to_protein_dict(entry_text):
         last_line = l
 
     # reprocess primary string to one hot
-    #import ipdb; ipdb.set_trace()
-    protein_dict['primary'] = np.array(string_vectorizer(protein_dict['primary']))[:, :20]
+    protein_dict['primary'] = one_hot(protein_dict['primary'], UPPERCASE_TABLE)[:, :20]
 
     # reprocess evolutionary part
     evolutionary = protein_dict.pop('evolutionary')
-    evolutionary = [[float(x) for x in line.split('\t')] for line in evolutionary]
-    evolutionary = np.array(evolutionary)
+    evolutionary = parse_numeric_lines(evolutionary)
     protein_dict['evolutionary'] = np.transpose(evolutionary, [1,0])
 
     # reprocess tertiary part
-    tertiary = [[float(x) for x in line.split('\t')] for line in protein_dict['tertiary']]
-    tertiary = np.array(tertiary).reshape((3,-1,3))
+    tertiary = parse_numeric_lines(protein_dict['tertiary'])
+    tertiary = tertiary.reshape((3,-1,3))
     tertiary = np.transpose(tertiary, [1,0,2])
-    #tertiary = torch.from_numpy(tertiary).unsqueeze(0)
-    #tertiary = compute_adjacency(tertiary).numpy()[0]
     protein_dict['tertiary'] = tertiary
-    #import ipdb; ipdb.set_trace()
-    #import ipdb; ipdb.set_trace()
 
     # reprocess mask
-    protein_dict['mask'] = np.array(string_vectorizer(protein_dict['mask'], ['+']))
+    protein_dict['mask'] = one_hot(protein_dict['mask'], MASK_TABLE)
 
     return protein_dict
 
-def make_protein_dicts_from_textfile(filename):
-    tail = filename.split('/')[-1]
-    with open(filename, 'r') as f:
-        contents = [l.strip() for l in f.read().split('\n')]
-
-    protein_dicts = process_textfile(contents)
-    return protein_dicts
-
-def preprocess(raw_data_dir, preprocessed_dir, filename):
+def convert_records(entries):
+    return [convert_to_protein_dict(entry) for entry in entries]
+
+def make_protein_dicts_from_textfile(filename, n_workers=None, batch_size=100):
+    '''
+    Parse a ProteinNet text file, converting batches of records in a process
+    pool. Proteins are yielded in file order as their batch comes back, so
+    they can be written out without ever holding the whole file.
+    '''
+    t = time.time()
+    n_proteins = 0
+    for batch in parallel_map(convert_records, chunks(iter_protein_records(filename), batch_size), n_workers):
+        n_proteins += len(batch)
+        for protein_dict in batch:
+            yield protein_dict
+    elapsed = max(time.time() - t, 1e-6)
+    megabytes = os.path.getsize(filename) / 2 ** 20
+    logging.info("Parsed {} proteins from {} in {:.1f} seconds ({:.0f} proteins/s, {:.1f} MB/s)".format(
+        n_proteins, filename, elapsed, n_proteins / elapsed, megabytes / elapsed))
+
+def preprocess(raw_data_dir, preprocessed_dir, filename, n_workers=None):
     subproblem = filename.split('-')[0]
 
     logging.info("Preprocessing training data...")
     #import ipdb; ipdb.set_trace()
 
     train_protein_filename = os.path.join(raw_data_dir, subproblem + '-train.txt')
-    train_protein_dicts = make_protein_dicts_from_textfile(train_protein_filename)
-    save_protein_dicts_to_pickle(train_protein_dicts, os.path.join(preprocessed_dir, subproblem + '-train.pickle'))
+    train_protein_dicts = make_protein_dicts_from_textfile(train_protein_filename, n_workers)
+    save_protein_dicts_to_store(train_protein_dicts, os.path.join(preprocessed_dir, subproblem + '-train.pickle'))
 
     logging.info("Preprocessing validation data...")
     valid_protein_filename = os.path.join(raw_data_dir, subproblem + '-valid.txt')
-    valid_protein_dicts = make_protein_dicts_from_textfile(valid_protein_filename)
-    save_protein_dicts_to_pickle(valid_protein_dicts, os.path.join(preprocessed_dir, subproblem + '-valid.pickle'))
+    valid_protein_dicts = make_protein_dicts_from_textfile(valid_protein_filename, n_workers)
+    save_protein_dicts_to_store(valid_protein_dicts, os.path.join(preprocessed_dir, subproblem + '-valid.pickle'))
 
     logging.info("Preprocessing test data...")
     test_protein_filename = os.path.join(raw_data_dir, subproblem + '-test.txt')
-    test_protein_dicts = make_protein_dicts_from_textfile(test_protein_filename)
-    save_protein_dicts_to_pickle(test_protein_dicts, os.path.join(preprocessed_dir, subproblem + '-test.pickle'))
+    test_protein_dicts = make_protein_dicts_from_textfile(test_protein_filename, n_workers)
+    save_protein_dicts_to_store(test_protein_dicts, os.path.join(preprocessed_dir, subproblem + '-test.pickle'))
 
     return None
@@ -19,6 +19,7 @@ from src.architectures.nmp.adjacency.simple.matrix_activation import padded_matr
 from src.architectures.readout import READOUTS
 from src.architectures.embedding import EMBEDDINGS
 from src.architectures.nmp.message_passing.vertex_update import GRUUpdate
+from src.architectures.utils import run_layers
 
 from src.monitors import Histogram
 from src.monitors import Collect
@@ -71,6 +72,7 @@ class GraphGen(nn.Module):
         mp_layer=None,
         no_grad=False,
         tied=False,
+        checkpoint_every=None,
         **kwargs
         ):
 
@@ -78,6 +80,7 @@ class GraphGen(nn.Module):
 
         self.iters = iters
         self.no_grad = no_grad
+        self.checkpoint_every = checkpoint_every
         if no_grad and not tied:
             logging.warning('no_grad set to True but tied = False. Setting tied = True')
             tied = True
@@ -121,12 +124,17 @@ class GraphGen(nn.Module):
         h = self.content_embedding(x)
         s = spatial_variable(bs, n_vertices)
 
-        A = self.adj(s, mask, **kwargs)
-
-        for i, mp in enumerate(self.mp_layers):
+        # the adjacency is recomputed from s at the start of each step, so
+        # that it is part of what checkpointing recomputes
+        def step(mp, state, inputs):
+            h, s = state
+            A = self.adj(s, mask, **kwargs)
             h = mp(h, A)
             s = self.positional_update(s, h)
-            A = self.adj(s, mask, **kwargs)
+            return h, s
+
+        h, s = run_layers(self.mp_layers, step, (h, s), (), self.checkpoint_every)
+        A = self.adj(s, mask, **kwargs)
 
         #del s
         #del h
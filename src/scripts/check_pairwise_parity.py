@@ -0,0 +1,53 @@
+import argparse
+import logging
+import sys
+import torch
+from torch.autograd import Variable
+sys.path.append('../..')
+from src.architectures.nmp.adjacency.pairwise import squared_distances, euclidean_distances, _broadcast_squared_distances, _broadcast_euclidean_distances
+
+''' Check the Gram-matrix distances against the broadcast kernels they replaced, values and gradients '''
+parser = argparse.ArgumentParser(description='Pairwise distance parity')
+parser.add_argument('--bs', type=int, default=4, help='batch size')
+parser.add_argument('-n', type=int, default=40, help='number of vertices')
+parser.add_argument('--dim', type=int, default=16, help='vertex dimension')
+parser.add_argument('--offset', type=float, default=100., help='shared offset of the vertices, which the Gram expansion has to cancel')
+parser.add_argument('--rtol', type=float, default=1e-4, help='tolerance, relative to the largest value')
+parser.add_argument('--seed', type=int, default=1, help='random seed')
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+def vertices(bs, n, dim, offset):
+    x = torch.randn(bs, n, dim) + offset
+    # exact duplicates and near duplicates, whose distance is zero or tiny
+    x[:, 1] = x[:, 0]
+    x[:, 3] = x[:, 2] + 1e-4 * torch.randn(bs, dim)
+    return x
+
+def values_and_grad(fn, x, w):
+    h = Variable(x.clone(), requires_grad=True)
+    A = fn(h)
+    (A * Variable(w)).sum().backward()
+    grad = h.grad.data
+    # the broadcast norm has no gradient at zero distance; take the zero subgradient
+    grad[grad != grad] = 0
+    return A.data, grad
+
+def check(name, reference, fn, x):
+    w = torch.rand(x.size(0), x.size(1), x.size(1))
+    A_ref, g_ref = values_and_grad(reference, x, w)
+    A, g = values_and_grad(fn, x, w)
+    scale = A_ref.abs().max()
+    assert (A - A_ref).abs().max() <= args.rtol * scale, "{}: values differ by {}".format(name, (A - A_ref).abs().max())
+    assert (g - g_ref).abs().max() <= args.rtol * max(g_ref.abs().max(), 1), "{}: gradients differ by {}".format(name, (g - g_ref).abs().max())
+    for b in range(x.size(0)):
+        assert A[b].diag().abs().max() == 0, "{}: nonzero diagonal".format(name)
+        assert A[b, 0, 1] == 0 and A[b, 1, 0] == 0, "{}: duplicates at nonzero distance".format(name)
+    logging.info("{}: max value diff {:.2e}, max grad diff {:.2e}".format(name, (A - A_ref).abs().max(), (g - g_ref).abs().max()))
+
+torch.manual_seed(args.seed)
+x = vertices(args.bs, args.n, args.dim, args.offset)
+check('squared distances', _broadcast_squared_distances, squared_distances, x)
+check('euclidean distances', _broadcast_euclidean_distances, euclidean_distances, x)
+logging.info("Gram-matrix distances match the broadcast kernels")
@@ -0,0 +1,81 @@
+import argparse
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import numpy as np
+sys.path.append('../..')
+from src.proteins.data_ops.preprocessing import iter_protein_records, convert_records, string_vectorizer, make_protein_dicts_from_textfile
+from src.proteins.data_ops.io import load_protein_dicts_from_pickle
+from src.proteins.data_ops.ProteinStore import ProteinStore, write_protein_store, RESIDUE_FIELDS
+
+''' Check that the streaming ProteinNet parser and its store reproduce the original pickled proteins '''
+parser = argparse.ArgumentParser(description='Protein preprocessing parity')
+parser.add_argument('textfile', type=str, help='raw ProteinNet text file')
+parser.add_argument('-n', type=int, default=50, help='number of records to check')
+parser.add_argument('--pickle', type=str, default=None, help='pickle preprocessed by the original code from the same file, to compare against as well')
+parser.add_argument('--n_workers', type=int, default=2, help='process pool size for the streaming parser')
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+def reference_protein_dict(entry_text):
+    # the original per-token parser, which wrote the existing pickles
+    protein_dict = dict(class_id=None, pdb_id=None, chain_number=None, chain_id=None, primary=None, evolutionary=[], secondary=[], tertiary=[], mask=[])
+    flags = ['[ID]', '[PRIMARY]', '[EVOLUTIONARY]', '[SECONDARY]','[TERTIARY]', '[MASK]']
+    processing = None
+    last_line = None
+    for l in entry_text:
+        if last_line in flags:
+            processing = last_line
+        if l in flags:
+            processing = None
+        if processing == '[PRIMARY]':
+            protein_dict['primary'] = l
+        elif processing in ['[EVOLUTIONARY]', '[SECONDARY]', '[TERTIARY]']:
+            protein_dict[processing[1:-1].lower()].append(l)
+        elif processing == '[MASK]':
+            protein_dict['mask'] = l
+        last_line = l
+    protein_dict['primary'] = np.array(string_vectorizer(protein_dict['primary']))[:, :20]
+    evolutionary = protein_dict.pop('evolutionary')
+    evolutionary = np.array([[float(x) for x in line.split('\t')] for line in evolutionary])
+    protein_dict['evolutionary'] = np.transpose(evolutionary, [1,0])
+    tertiary = np.array([[float(x) for x in line.split('\t')] for line in protein_dict['tertiary']]).reshape((3,-1,3))
+    protein_dict['tertiary'] = np.transpose(tertiary, [1,0,2])
+    protein_dict['mask'] = np.array(string_vectorizer(protein_dict['mask'], ['+']))
+    return protein_dict
+
+def assert_same(a, b, what):
+    assert sorted(a.keys()) == sorted(b.keys()), "{}: keys {} != {}".format(what, sorted(a.keys()), sorted(b.keys()))
+    for key in a:
+        x, y = a[key], b[key]
+        if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+            assert x.dtype == y.dtype and x.shape == y.shape, "{} {}: {} {} != {} {}".format(what, key, x.dtype, x.shape, y.dtype, y.shape)
+            assert np.array_equal(x, y), "{} {}: values differ".format(what, key)
+        else:
+            assert x == y, "{} {}: {} != {}".format(what, key, x, y)
+
+records = list(itertools.islice(iter_protein_records(args.textfile), args.n))
+reference = [reference_protein_dict(entry) for entry in records]
+
+# the parser, serially and through the process pool
+for i, pd in enumerate(convert_records(records)):
+    assert_same(pd, reference[i], "protein {}".format(i))
+streamed = itertools.islice(make_protein_dicts_from_textfile(args.textfile, args.n_workers), len(records))
+for i, pd in enumerate(streamed):
+    assert_same(pd, reference[i], "streamed protein {}".format(i))
+
+if args.pickle is not None:
+    for i, pd in enumerate(load_protein_dicts_from_pickle(args.pickle)[:len(records)]):
+        assert_same(pd, reference[i], "pickled protein {}".format(i))
+
+# the store gives back the same arrays, in the same dtypes
+with tempfile.TemporaryDirectory() as tmp:
+    store = ProteinStore(write_protein_store(os.path.join(tmp, 'sample.proteins'), iter(reference)))
+    assert len(store) == len(reference)
+    for i, protein in enumerate(store):
+        assert_same({name: np.asarray(getattr(protein, name)) for name in RESIDUE_FIELDS}, {name: reference[i][name] for name in RESIDUE_FIELDS}, "stored protein {}".format(i))
+
+logging.info("{} proteins from {} match the original preprocessing".format(len(records), args.textfile))
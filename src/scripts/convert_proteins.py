@@ -0,0 +1,32 @@
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+sys.path.append('../..')
+from src.proteins.data_ops.io import convert_pickle_to_store
+from src.proteins.data_ops.ProteinStore import store_exists, store_path
+
+''' Convert preprocessed protein pickles to memory-mapped array stores '''
+parser = argparse.ArgumentParser(description='Proteins')
+parser.add_argument('files', type=str, nargs='+', help='preprocessed *.pickle files (or directories containing them)')
+parser.add_argument('-f', '--force', action='store_true', default=False, help='overwrite existing stores')
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+filenames = []
+for f in args.files:
+    if os.path.isdir(f):
+        filenames.extend(sorted(glob.glob(os.path.join(f, '*.pickle'))))
+    else:
+        filenames.append(f)
+
+for filename in filenames:
+    if store_exists(filename) and not args.force:
+        logging.info("{} already exists, skipping".format(store_path(filename)))
+        continue
+    t = time.time()
+    path = convert_pickle_to_store(filename)
+    logging.info("Converted {} to {} in {:.1f} seconds".format(filename, path, time.time() - t))
@@ -87,8 +87,22 @@ data = parser.add_argument_group('data')
 data.add_argument("-n", "--n_test", type=int, default=-1)
 #data.add_argument("--n_", type=int, default=27000)
 data.add_argument("--dataset", type=str, default='w')
-data.add_argument("--dropout", type=float, default=.99)
+data.add_argument("--dropout", type=float, default=None, help='keep probability of particle dropout, a training augmentation (default: none)')
 data.add_argument("--pp", action='store_true', default=False)
+data.add_argument("--pp_workers", type=int, default=None, help='number of processes used for preprocessing (default: all cores)')
+data.add_argument("--bucket_size", type=int, default=None, help='group examples of similar length into batches, sorting pools of this many batches (default: no bucketing)')
+data.add_argument("--max_n2", type=int, default=None, help='with --bucket_size, cap batch size * (longest example)^2')
+data.add_argument("--token_budget", type=int, default=None, help='fill each batch up to this padded cost instead of --batch_size examples (implies bucketing)')
+data.add_argument("--budget_mode", type=str, default='n2', choices=['n2', 'n'], help='cost of a batch for --token_budget: batch size * (longest length)^2 or * (longest length)')
+data.add_argument("--num_workers", type=int, default=0, help='number of worker processes collating batches')
+data.add_argument("--pin_memory", action='store_true', default=False, help='collate batches into pinned memory for faster transfer to the GPU')
+data.add_argument("--prefetch", type=int, default=0, help='number of batches collated and moved to the device ahead of time in a background thread (default: off)')
+data.add_argument("--cache_batches", action='store_true', default=False, help='collate the validation/test set once and replay the batches')
+data.add_argument("--cache_budget", type=float, default=1024, help='memory budget of the batch cache in MB, past which batches are spilled to disk')
+data.add_argument("--cache_device", action='store_true', default=False, help='keep cached batches on the device rather than in pinned host memory')
+data.add_argument("--cache_dir", type=str, default=None, help='where cached batches are spilled (default: a temporary directory)')
+data.add_argument("--crop_len", type=int, default=None, help='proteins: train on random windows of at most this many residues, evaluate on stitched windows')
+data.add_argument("--cache_adj", action='store_true', help='jets: compute fixed adjacencies (phy, one, eye) once per jet and keep them next to the preprocessed data')
 data.add_argument("--permute_particles", action='store_true')
 data.add_argument("--leaves", action='store_true')
 
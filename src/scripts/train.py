@@ -85,6 +85,20 @@ data.add_argument("--n_valid", type=int, default=10000)
 data.add_argument("--dataset", type=str, default='protein')
 data.add_argument("--data_dropout", type=float, default=.99)
 data.add_argument("--pp", action='store_true', default=False)
+data.add_argument("--pp_workers", type=int, default=None, help='number of processes used for preprocessing (default: all cores)')
+data.add_argument("--bucket_size", type=int, default=None, help='group examples of similar length into batches, sorting pools of this many batches (default: no bucketing)')
+data.add_argument("--max_n2", type=int, default=None, help='with --bucket_size, cap batch size * (longest example)^2')
+data.add_argument("--token_budget", type=int, default=None, help='fill each batch up to this padded cost instead of --batch_size examples (implies bucketing)')
+data.add_argument("--budget_mode", type=str, default='n2', choices=['n2', 'n'], help='cost of a batch for --token_budget: batch size * (longest length)^2 or * (longest length)')
+data.add_argument("--num_workers", type=int, default=0, help='number of worker processes collating batches')
+data.add_argument("--pin_memory", action='store_true', default=False, help='collate batches into pinned memory for faster transfer to the GPU')
+data.add_argument("--prefetch", type=int, default=0, help='number of batches collated and moved to the device ahead of time in a background thread (default: off)')
+data.add_argument("--cache_batches", action='store_true', default=False, help='collate the validation/test set once and replay the batches')
+data.add_argument("--cache_budget", type=float, default=1024, help='memory budget of the batch cache in MB, past which batches are spilled to disk')
+data.add_argument("--cache_device", action='store_true', default=False, help='keep cached batches on the device rather than in pinned host memory')
+data.add_argument("--cache_dir", type=str, default=None, help='where cached batches are spilled (default: a temporary directory)')
+data.add_argument("--crop_len", type=int, default=None, help='proteins: train on random windows of at most this many residues, evaluate on stitched windows')
+data.add_argument("--cache_adj", action='store_true', help='jets: compute fixed adjacencies (phy, one, eye) once per jet and keep them next to the preprocessed data')
 data.add_argument("--permute_vertices", action='store_true')
 data.add_argument("--no_cropped", action='store_true')
 
@@ -113,12 +127,16 @@ model.add_argument("--message", type=str, default='2', help='type of message')
 model.add_argument("--emb_init", type=str, default='1', help='type of message')
 model.add_argument("-a","--adj", type=str, nargs='+', default='dm', help='type of matrix layer')
 model.add_argument("--asym", action='store_true', default=False)
+model.add_argument("--adj_sparse", type=int, default=None, help='pass messages along the k nearest neighbours in (eta, phi) only (0: no limit, with --adj_radius)')
+model.add_argument("--adj_heads", type=int, default=1, help='number of heads of the attn matrix')
+model.add_argument("--adj_radius", type=float, default=None, help='with sparse adjacency, only keep neighbours within this delta R')
 model.add_argument("--readout", type=str, default='dtnn', help='type of readout layer')
 model.add_argument("--m_act", type=str, default='sigmoid', help='type of nonlinearity for matrices' )
 model.add_argument("--lf", type=int, default=20)
 model.add_argument("--wn", action='store_true')
 model.add_argument("--no_grad", action='store_true')
 model.add_argument("--tied", action='store_true')
+model.add_argument("--checkpoint_every", type=int, default=None, help='recompute message passing in backward, keeping the state every this many layers (default: keep everything)')
 
 # Stack NMP
 model.add_argument("--pool_first", action='store_true', default=False)
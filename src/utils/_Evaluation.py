@@ -48,6 +48,7 @@ class _Evaluation:
             train=False,**all_args
             )
         model_filenames = self.get_model_filenames(**vars(self.loading_args))
+        self.model_filenames = model_filenames
 
         data_loader = self.load_data(**vars(self.data_args))
 
@@ -106,6 +107,10 @@ class _Evaluation:
         mb = self.ModelBuilder(*args, **kwargs)
         return mb.model, mb.model_kwargs
 
+    def prepare_data(self, model, filename, data_loader):
+        ''' Hook for data that depends on the model saved at filename, e.g. its scaler '''
+        pass
+
     def loss(self,y_pred, y, mask):
         raise NotImplementedError
 
@@ -119,6 +124,7 @@ class _Evaluation:
             logging.info("Loaded {}. Now testing".format(filename))
 
             administrator.signal_handler.set_model(model)
+            self.prepare_data(model, filename, data_loader)
 
             t_valid = time.time()
             logdict = self.test_one_model(model, data_loader, filename)
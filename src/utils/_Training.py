@@ -14,6 +14,7 @@ import torch.nn.functional as F
 #from ..data_ops.load_dataset import load_train_dataset
 #from ..data_ops.proteins.ProteinLoader import ProteinLoader as DataLoader
 from src.data_ops.wrapping import unwrap
+from src.data_ops.Prefetcher import prefetch
 
 #from ..misc.constants import *
 from src.optim.build_optimizer import build_optimizer
@@ -28,7 +29,7 @@ from src.optim.build_scheduler import build_scheduler
 
 #from ..misc.grad_mode import no_grad
 
-from src.admin.utils import log_gpu_usage
+from src.admin.utils import log_gpu_usage, gpu_memory_mark, peak_gpu_memory
 
 
 class _Training:
@@ -88,6 +89,7 @@ class _Training:
             }
 
         administrator.signal_handler.set_model(model)
+        self.prepare_data(model, train_data_loader, valid_data_loader)
         #log_gpu_usage()
 
         ''' OPTIMIZER AND SCHEDULER '''
@@ -102,6 +104,7 @@ class _Training:
         ''' TRAINING '''
         '''----------------------------------------------------------------------- '''
         administrator.save(model, settings)
+        self.save_data_artifacts(train_data_loader.dataset, administrator.exp_dir)
         time_limit = self.training_args.experiment_time * 60 * 60 - 60
         epochs = self.training_args.epochs
         clip = self.optim_args.clip
@@ -146,6 +149,14 @@ class _Training:
         raise NotImplementedError
 
 
+    def prepare_data(self, model, *data_loaders):
+        ''' Hook for data that depends on the model, e.g. cached adjacencies '''
+        pass
+
+    def save_data_artifacts(self, dataset, exp_dir):
+        '''Save whatever evaluation needs to process data like the training set did'''
+        pass
+
     def build_model(self, *args, **kwargs):
         mb = self.ModelBuilder(*args, **kwargs)
         return mb.model, mb.model_kwargs
@@ -157,6 +168,10 @@ class _Training:
     def validation(self,model, data_loader):
         raise NotImplementedError
 
+    def batch_size(self, batch):
+        ''' Number of examples in a batch '''
+        raise NotImplementedError
+
 
     def train_one_batch(self,model, batch, optimizer, administrator, epoch, batch_number, clip):
         raise NotImplementedError
@@ -164,19 +179,29 @@ class _Training:
     def train_one_epoch(self,model, data_loader, optimizer, scheduler, administrator, epoch, iteration, clip):
 
         train_loss = 0.0
+        n_examples = 0
         t_train = time.time()
+        memory_mark = gpu_memory_mark()
+        n_batches = 0
 
-        for batch_number, batch in enumerate(data_loader):
+        for batch_number, batch in enumerate(prefetch(data_loader, self.data_args.prefetch)):
             iteration += 1
             tl = self.train_one_batch(model, batch, optimizer, administrator, epoch, batch_number, clip)
-            train_loss += tl
+            # batches vary in size under a token budget, so weight by examples
+            n = self.batch_size(batch)
+            train_loss += tl * n
+            n_examples += n
+            n_batches += 1
         scheduler.step()
 
-        n_batches = len(data_loader)
-
-        train_loss = train_loss / n_batches
+        train_loss = train_loss / max(n_examples, 1)
         train_time = time.time() - t_train
-        logging.info("Training {} batches took {:.1f} seconds at {:.1f} examples per second".format(n_batches, train_time, len(data_loader.dataset)/train_time))
+        logging.info("Training {} batches took {:.1f} seconds at {:.1f} examples per second".format(n_batches, train_time, n_examples/train_time))
+        peak_memory = peak_gpu_memory(memory_mark)
+        if peak_memory is not None:
+            # the memory / time trade-off of --checkpoint_every
+            logging.info("Peak GPU memory {:.1f}MB, {:.3f} seconds per batch (checkpointing every {} layers)".format(
+                peak_memory, train_time / max(n_batches, 1), getattr(self.model_args, 'checkpoint_every', None)))
 
         train_dict = dict(
             train_loss=train_loss,